@@ -0,0 +1,206 @@
+"""Offline benchmarks for the MTTx metric calculator.
+
+Generates execute_dashboard_query-shaped payloads for a synthetic tenant and times
+json_to_dataframe and calculate_soc_metrics_structured at increasing event counts,
+recording the wall time and the peak memory of each stage. No tenant is needed.
+
+    python benchmark.py                                  # 1k, 10k, 100k and 1M events
+    python benchmark.py --events 10000 100000 --output baseline.json
+    python benchmark.py --compare baseline.json          # fail if slower than the baseline
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+
+DEFAULT_EVENT_COUNTS = (1_000, 10_000, 100_000, 1_000_000)
+DEFAULT_STAGE_MIX = {"Triage": 0.4, "Investigation": 0.3, "Incident": 0.2, None: 0.1}
+DEFAULT_STATUS_MIX = {"OPENED": 0.85, "CLOSED": 0.15}
+ACTIVITY_MIX = {"STAGE_CHANGE": 0.5, "STATUS_CHANGE": 0.2, "COMMENT": 0.2, "ASSIGN": 0.1}
+TAG_CHOICES = ([], ["True Positive"], ["False Positive", "Noise"], ["Phishing"])
+ENVIRONMENT_CHOICES = ([], ["Default"], ["Prod"], ["Prod", "EU"])
+RULE_CHOICES = ([], ["rule_a"], ["rule_b"], ["rule_c", "rule_d"])
+
+
+class _CellEncoder:
+    """Encodes values as execute_dashboard_query cells, sharing one cell object per distinct value.
+
+    Stages, statuses, case IDs and list values repeat heavily, so sharing keeps a 1M event payload
+    within a few hundred MB. The calculator only reads the payload, so shared cells are safe.
+    """
+
+    def __init__(self):
+        self._cells = {}
+
+    def __call__(self, value: Any) -> Dict[str, Any]:
+        key = tuple(value) if isinstance(value, list) else value
+        cell = self._cells.get(key)
+        if cell is None:
+            if value is None:
+                cell = {}
+            elif isinstance(value, list):
+                cell = {"list": {"values": [{"stringVal": v} for v in value]}}
+            elif isinstance(value, int):
+                cell = {"value": {"int64Val": str(value)}}
+            else:
+                cell = {"value": {"stringVal": value}}
+            if not isinstance(value, int):
+                self._cells[key] = cell
+        return cell
+
+
+def _to_payload(columns: Dict[str, List[Any]], encode: _CellEncoder) -> Dict[str, Any]:
+    return {"results": [{"column": name, "values": [encode(v) for v in values]} for name, values in columns.items()]}
+
+
+def _weighted_choice(rng: np.random.Generator, mix: Dict[Any, float], size: int) -> List[Any]:
+    options = list(mix)
+    weights = np.array([mix[o] for o in options], dtype=float)
+    picks = rng.choice(len(options), size=size, p=weights / weights.sum())
+    return [options[i] for i in picks]
+
+
+def generate_case_payloads(
+    num_cases: int,
+    events_per_case: int = 10,
+    stage_mix: Optional[Dict[Any, float]] = None,
+    status_mix: Optional[Dict[str, float]] = None,
+    seed: int = 0
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Returns (case_history_data, case_mttd_data) payloads for num_cases cases.
+
+    Every case starts with a CREATE_CASE event followed by events_per_case - 1 events a few
+    minutes to a few hours apart, whose stage and status are drawn from stage_mix and status_mix
+    (value -> weight). History rows are shuffled, as the query does not order them.
+    """
+    rng = np.random.default_rng(seed)
+    stage_mix = stage_mix or DEFAULT_STAGE_MIX
+    status_mix = status_mix or DEFAULT_STATUS_MIX
+    num_events = num_cases * events_per_case
+
+    case_ids = [str(100_000 + i) for i in range(num_cases)]
+    created = 1_700_000_000 + rng.integers(0, 86400 * 30, size=num_cases)
+    # Gaps between events; the first event of each case is its creation.
+    gaps = rng.integers(60, 7200, size=(num_cases, events_per_case))
+    gaps[:, 0] = 0
+    event_times = (created[:, None] + gaps.cumsum(axis=1)).ravel()
+
+    activities = _weighted_choice(rng, ACTIVITY_MIX, num_events)
+    stages = _weighted_choice(rng, stage_mix, num_events)
+    statuses = _weighted_choice(rng, status_mix, num_events)
+    for first in range(0, num_events, events_per_case):
+        activities[first], stages[first], statuses[first] = "CREATE_CASE", "Triage", "OPENED"
+
+    order = rng.permutation(num_events)
+    history = {
+        "case_history_case_id": [case_ids[i // events_per_case] for i in order],
+        "case_history_case_activity": [activities[i] for i in order],
+        "case_history_case_event_time": [int(event_times[i]) for i in order],
+        "case_history_stage": [stages[i] for i in order],
+        "case_history_status": [statuses[i] for i in order],
+    }
+    mttd = {
+        "case_id": case_ids,
+        "created_time": [int(c) for c in created],
+        "min_event_ts": [int(c) for c in created - rng.integers(0, 36000, size=num_cases)],
+        "tags": [TAG_CHOICES[i] for i in rng.integers(0, len(TAG_CHOICES), size=num_cases)],
+        "environment": [ENVIRONMENT_CHOICES[i] for i in rng.integers(0, len(ENVIRONMENT_CHOICES), size=num_cases)],
+        "detection_rule_name": [RULE_CHOICES[i] for i in rng.integers(0, len(RULE_CHOICES), size=num_cases)],
+    }
+    encode = _CellEncoder()
+    return _to_payload(history, encode), _to_payload(mttd, encode)
+
+
+def _measure(func, *args, repeat: int = 1) -> Tuple[Any, float, float]:
+    """Returns (result, best wall seconds of repeat runs, peak traced MB of one extra run).
+
+    Memory is traced in a separate run because tracemalloc slows allocation-heavy code down.
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, min(seconds), peak / 1024 ** 2
+
+
+def run_benchmark(event_counts=DEFAULT_EVENT_COUNTS, events_per_case: int = 10, repeat: int = 3, seed: int = 0) -> List[Dict[str, Any]]:
+    """Times json_to_dataframe and calculate_soc_metrics_structured for each event count."""
+    engine = create_engine("sqlite://")
+    main.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    results = []
+    try:
+        for num_events in event_counts:
+            num_cases = max(1, num_events // events_per_case)
+            history, mttd = generate_case_payloads(num_cases, events_per_case, seed=seed)
+            _, parse_seconds, parse_peak_mb = _measure(main.json_to_dataframe, history, repeat=repeat)
+            metrics, calculate_seconds, calculate_peak_mb = _measure(
+                main.calculate_soc_metrics_structured, history, mttd, db, 1, repeat=repeat)
+            results.append({
+                "events": num_cases * events_per_case,
+                "cases": num_cases,
+                "parse_seconds": round(parse_seconds, 4),
+                "parse_peak_mb": round(parse_peak_mb, 1),
+                "calculate_seconds": round(calculate_seconds, 4),
+                "calculate_peak_mb": round(calculate_peak_mb, 1),
+                "cases_calculated": metrics["completion_rates"]["total_cases"],
+            })
+            print(json.dumps(results[-1]), flush=True)
+    finally:
+        db.close()
+    return results
+
+
+def compare_results(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Returns a message for every measurement more than tolerance (a fraction) above the baseline."""
+    regressions = []
+    baseline_by_events = {b["events"]: b for b in baseline}
+    for result in results:
+        previous = baseline_by_events.get(result["events"])
+        if not previous:
+            continue
+        for key in ("parse_seconds", "parse_peak_mb", "calculate_seconds", "calculate_peak_mb"):
+            if result[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{result['events']} events: {key} {previous[key]} -> {result[key]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the MTTx metric calculator on synthetic payloads.")
+    parser.add_argument("--events", type=int, nargs="+", default=list(DEFAULT_EVENT_COUNTS), help="History event counts to run.")
+    parser.add_argument("--events-per-case", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per measurement; the fastest is kept.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Baseline JSON file from an earlier --output run.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown or memory growth over the baseline.")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run_benchmark(args.events, args.events_per_case, args.repeat, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        sys.exit(1 if regressions else 0)
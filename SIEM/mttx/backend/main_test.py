@@ -0,0 +1,1424 @@
+"""Unit tests for the MTTx backend metric calculation."""
+
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+from fastapi import Response
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import benchmark
+import main
+
+
+def _cell(value):
+    """Wraps a Python value the way execute_dashboard_query returns it."""
+    if value is None:
+        return {}
+    if isinstance(value, list):
+        return {"list": {"values": [{"stringVal": v} for v in value]}}
+    if isinstance(value, int):
+        return {"value": {"int64Val": str(value)}}
+    return {"value": {"stringVal": value}}
+
+
+def _payload(columns):
+    """Builds a dashboard query payload from a dict of column -> list of values."""
+    return {
+        "results": [
+            {"column": name, "values": [_cell(v) for v in values]}
+            for name, values in columns.items()
+        ]
+    }
+
+
+def _recorded_case_data(seed, num_cases=60):
+    """Generates case history and MTTD payloads covering the calculator's edge cases."""
+    rng = random.Random(seed)
+    history = {
+        "case_history_case_id": [], "case_history_case_activity": [],
+        "case_history_case_event_time": [], "case_history_stage": [],
+        "case_history_status": [],
+    }
+    mttd = {
+        "case_id": [], "created_time": [], "min_event_ts": [], "tags": [],
+        "environment": [], "detection_rule_name": [],
+    }
+
+    def add_event(case_id, activity, ts, stage, status):
+        history["case_history_case_id"].append(case_id)
+        history["case_history_case_activity"].append(activity)
+        history["case_history_case_event_time"].append(ts)
+        history["case_history_stage"].append(stage)
+        history["case_history_status"].append(status)
+
+    for i in range(num_cases):
+        case_id = str(1000 + i)
+        created = 1_700_000_000 + rng.randint(0, 86400 * 30)
+        if rng.random() > 0.1:
+            add_event(case_id, "CREATE_CASE", created, "Triage", "OPENED")
+        ts = created
+        for _ in range(rng.randint(0, 6)):
+            ts += rng.randint(-300, 7200)
+            activity = rng.choice(["STAGE_CHANGE", "STAGE_CHANGE", "COMMENT", "ASSIGN"])
+            stage = rng.choice(["Triage", "Investigation", "Incident", None])
+            status = rng.choice(["OPENED", "OPENED", "CLOSED"])
+            add_event(case_id, activity, ts, stage, status)
+
+        # Some cases only exist in the history query and must be ignored.
+        if rng.random() < 0.1:
+            continue
+        for _ in range(2 if rng.random() < 0.05 else 1):
+            mttd["case_id"].append(case_id)
+            mttd["created_time"].append(created)
+            mttd["min_event_ts"].append(created - rng.randint(-600, 36000))
+            mttd["tags"].append(rng.choice([[], ["True Positive"], ["FP", "Noise"]]))
+            mttd["environment"].append(rng.choice([[], ["Default"], ["Prod", "EU"]]))
+            mttd["detection_rule_name"].append(rng.choice([[], ["rule_a"], ["rule_b"]]))
+
+    # Shuffle the history rows so the calculator cannot rely on input order.
+    order = list(range(len(history["case_history_case_id"])))
+    rng.shuffle(order)
+    history = {k: [v[i] for i in order] for k, v in history.items()}
+    history_payload = _payload(history)
+    # The API returns nulls both as an empty cell and as an explicit null value.
+    for column in history_payload["results"]:
+        if column["column"] == "case_history_stage":
+            empty_cells = [i for i, cell in enumerate(column["values"]) if not cell]
+            for i in empty_cells[::2]:
+                column["values"][i] = {"value": None}
+    return history_payload, _payload(mttd)
+
+
+def _reference_metrics(case_history_data, case_mttd_data, mttc_config, mttr_config):
+    """The original per-case loop implementation, kept as a regression oracle."""
+    df_mttd = main.json_to_dataframe(case_mttd_data)
+    df_history = main.json_to_dataframe(case_history_data)
+    valid_case_ids = df_mttd["case_id"].unique()
+    df_history_filtered = df_history[
+        df_history["case_history_case_id"].isin(valid_case_ids)].copy()
+    df_history_filtered["case_history_case_event_time"] = pd.to_numeric(
+        df_history_filtered["case_history_case_event_time"])
+    case_ids = df_history_filtered["case_history_case_id"].unique()
+    total_cases = len(case_ids)
+
+    individual_case_metrics = {}
+    mtta_values, mttc_values, mttr_values = [], [], []
+    for case_id in case_ids:
+        case_df = df_history_filtered[
+            df_history_filtered["case_history_case_id"] == case_id].sort_values(
+                by="case_history_case_event_time")
+        results = {}
+        create_events = case_df[case_df["case_history_case_activity"] == "CREATE_CASE"]
+        if create_events.empty:
+            continue
+        time_created = create_events["case_history_case_event_time"].iloc[0]
+        stage_changes = case_df[
+            (case_df["case_history_case_activity"] == "STAGE_CHANGE")
+            & (case_df["case_history_case_event_time"] > time_created)]
+        time_first_action = stage_changes["case_history_case_event_time"].min()
+        time_contained = case_df[
+            case_df[mttc_config[0]] == mttc_config[1]]["case_history_case_event_time"].min()
+        time_closed = case_df[
+            case_df[mttr_config[0]] == mttr_config[1]]["case_history_case_event_time"].min()
+        results["MTTA"] = int(time_first_action - time_created) if pd.notna(time_first_action) else "-"
+        if pd.notna(time_first_action):
+            mtta_values.append(time_first_action - time_created)
+        results["MTTC"] = int(time_contained - time_first_action) if pd.notna(time_contained) and pd.notna(time_first_action) else "-"
+        if pd.notna(time_contained) and pd.notna(time_first_action):
+            mttc_values.append(time_contained - time_first_action)
+        results["MTTR"] = int(time_closed - time_first_action) if pd.notna(time_closed) and pd.notna(time_first_action) else "-"
+        if pd.notna(time_closed) and pd.notna(time_first_action):
+            mttr_values.append(time_closed - time_first_action)
+        individual_case_metrics[case_id] = results
+
+    mttd_values = []
+    df_mttd["created_time"] = pd.to_numeric(df_mttd["created_time"])
+    df_mttd["min_event_ts"] = pd.to_numeric(df_mttd["min_event_ts"])
+    df_mttd["mttd_seconds"] = df_mttd["created_time"] - df_mttd["min_event_ts"]
+    for _, row in df_mttd.iterrows():
+        case_id = row["case_id"]
+        if case_id in individual_case_metrics:
+            mttd = row["mttd_seconds"]
+            tags = row.get("tags", [])
+            individual_case_metrics[case_id]["tags"] = tags if isinstance(tags, list) else [tags] if pd.notna(tags) else []
+            env = row.get("environment", "Unknown")
+            individual_case_metrics[case_id]["environment"] = (", ".join(env) if isinstance(env, list) else env) or "Unknown"
+            rule = row.get("detection_rule_name", "Unknown")
+            individual_case_metrics[case_id]["detection_rule_name"] = (", ".join(rule) if isinstance(rule, list) else rule) or "Unknown"
+            if pd.notna(mttd) and mttd >= 0:
+                individual_case_metrics[case_id]["MTTD"] = int(mttd)
+                mttd_values.append(mttd)
+            else:
+                individual_case_metrics[case_id]["MTTD"] = "-"
+
+    for case_id in individual_case_metrics:
+        individual_case_metrics[case_id].setdefault("MTTD", "-")
+        individual_case_metrics[case_id].setdefault("tags", [])
+        individual_case_metrics[case_id].setdefault("environment", "Unknown")
+        individual_case_metrics[case_id].setdefault("detection_rule_name", "Unknown")
+
+    avg_mtta, avg_mttc, avg_mttr, avg_mttd = (np.mean(vals) if vals else 0 for vals in [mtta_values, mttc_values, mttr_values, mttd_values])
+    comp_mtta, comp_mttc, comp_mttr, comp_mttd = ((len(vals) / total_cases) * 100 if total_cases > 0 else 0 for vals in [mtta_values, mttc_values, mttr_values, mttd_values])
+    average_metrics = {"Average_MTTA_seconds": int(avg_mtta), "Average_MTTC_seconds": int(avg_mttc), "Average_MTTR_seconds": int(avg_mttr), "Average_MTTD_seconds": int(avg_mttd)}
+    histograms = {}
+    for metric, vals in (("MTTA", mtta_values), ("MTTC", mttc_values), ("MTTR", mttr_values), ("MTTD", mttd_values)):
+        for key, q in zip(("Min", "P50", "P90", "P95", "P99", "Max"), (0, 50, 90, 95, 99, 100)):
+            average_metrics[f"{key}_{metric}_seconds"] = int(np.percentile(vals, q)) if vals else 0
+        histograms[metric] = [{"bucket": label, "upper_seconds": upper, "count": 0} for upper, label in main.HISTOGRAM_BUCKETS]
+        for value in vals:
+            bucket = next(b for b in histograms[metric] if b["upper_seconds"] is None or value < b["upper_seconds"])
+            bucket["count"] += 1
+    return {
+        "individual_cases": individual_case_metrics,
+        "average_metrics": average_metrics,
+        "completion_rates": {"MTTA_completion_percent": round(comp_mtta, 2), "MTTC_completion_percent": round(comp_mttc, 2), "MTTR_completion_percent": round(comp_mttr, 2), "MTTD_completion_percent": round(comp_mttd, 2), "total_cases": total_cases},
+        "histograms": histograms,
+    }
+
+
+class TestJsonToDataframe(unittest.TestCase):
+    """Unit test class for json_to_dataframe."""
+
+    def test_typed_columns(self):
+        """Test case to verify columns are decoded with their query value types."""
+        df = main.json_to_dataframe({"results": [
+            {"column": "case_id", "values": [_cell("1"), _cell("2")]},
+            {"column": "created_time", "values": [_cell(10), _cell(20)]},
+            {"column": "score", "values": [{"value": {"doubleVal": 0.5}}, {}]},
+            {"column": "tags", "values": [_cell(["a", ""]), _cell([])]},
+        ]})
+
+        self.assertEqual(list(df["case_id"]), ["1", "2"])
+        self.assertEqual(df["created_time"].dtype, np.int64)
+        self.assertEqual(list(df["created_time"]), [10, 20])
+        self.assertEqual(df["score"].dtype, np.float64)
+        self.assertTrue(np.isnan(df["score"].iloc[1]))
+        self.assertEqual(list(df["tags"]), [["a"], []])
+
+    def test_nulls_and_mixed_cells(self):
+        """Test case to verify nulls, metadata, short columns and mixed value types.
+
+        Asserts:
+          Timestamp columns with nulls become float64 NaN, and a column whose
+          cells use different value types decodes each cell individually.
+        """
+        df = main.json_to_dataframe({"results": [
+            {"column": "case_history_case_event_time", "values": [
+                {"value": {}}, {"value": {"int64Val": "5", "metadata": {}}}, _cell(7)]},
+            {"column": "case_history_stage", "values": [
+                _cell("Triage"), {"value": {"int64Val": "3"}}]},
+        ]})
+
+        self.assertEqual(df["case_history_case_event_time"].dtype, np.float64)
+        self.assertTrue(np.isnan(df["case_history_case_event_time"].iloc[0]))
+        self.assertEqual(list(df["case_history_case_event_time"].iloc[1:]), [5.0, 7.0])
+        self.assertEqual(list(df["case_history_stage"].iloc[:2]), ["Triage", "3"])
+        self.assertTrue(pd.isna(df["case_history_stage"].iloc[2]))
+
+    def test_empty_results(self):
+        """Test case to verify an empty DataFrame when the query returned no rows."""
+        self.assertTrue(main.json_to_dataframe({"results": [{"column": "a", "values": []}]}).empty)
+        self.assertTrue(main.json_to_dataframe({}).empty)
+
+
+class _FakeChronicle:
+    """Serves history rows from memory, honouring the query's interval and row limit."""
+
+    def __init__(self, events, limit):
+        self.events = events
+        self.limit = limit
+        self.calls = 0
+
+    def execute_dashboard_query(self, query, interval):
+        self.calls += 1
+        window = interval["absoluteTime"]
+        start = datetime.strptime(window["startTime"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+        end = datetime.strptime(window["endTime"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+        # Both bounds are inclusive so rows on a window boundary are returned twice.
+        rows = [e for e in self.events if start <= e[2] <= end][:self.limit]
+        return _payload({
+            "case_history_case_id": [r[0] for r in rows],
+            "case_history_case_activity": [r[1] for r in rows],
+            "case_history_case_event_time": [r[2] for r in rows],
+        })
+
+
+class TestTimeSlicedFetch(unittest.TestCase):
+    """Unit test class for the time-sliced query fetch."""
+
+    QUERY = """
+$case_history_case_id = case_history.case_response_platform_info.case_id
+match: $case_history_case_id, $case_history_case_activity, $case_history_case_event_time
+limit: 50
+"""
+
+    def test_fetches_every_row_despite_limit(self):
+        """Test case to verify windows are split until no window is truncated."""
+        now = int(datetime.now(timezone.utc).timestamp())
+        rng = random.Random(7)
+        events = sorted({(str(i % 40), "STAGE_CHANGE", now - rng.randint(120, 86400 * 3)) for i in range(600)}, key=lambda e: e[2])
+        chronicle = _FakeChronicle(events, limit=50)
+
+        results, limit_hit, windows = main.fetch_query_time_sliced(chronicle, self.QUERY, "DAY", 3)
+
+        df = main.json_to_dataframe(results)
+        self.assertFalse(limit_hit)
+        self.assertGreater(windows, 1)
+        self.assertEqual(len(df), len(events))
+        self.assertEqual(sorted(df["case_history_case_event_time"]), [e[2] for e in events])
+
+    def test_merges_outcome_aggregations(self):
+        """Test case to verify per-case outcome rows from two windows are combined."""
+        query = """
+match: $case_id
+outcome:
+    $created_time = max(case.create_time.seconds)
+    $min_event_ts = min(case.alerts.metadata.event_timestamp.seconds)
+    $tags = array_distinct(case.tags.name)
+limit: 100
+"""
+        window_a = _payload({"case_id": ["1", "2"], "created_time": [100, 200], "min_event_ts": [50, 150], "tags": [["a"], []]})
+        window_b = _payload({"case_id": ["1"], "created_time": [90], "min_event_ts": [40], "tags": [["a", "b"]]})
+
+        df = main.json_to_dataframe(main.merge_query_results(query, [window_a, window_b]))
+
+        self.assertEqual(list(df["case_id"]), ["1", "2"])
+        self.assertEqual(list(df["created_time"]), [100, 200])
+        self.assertEqual(list(df["min_event_ts"]), [40, 150])
+        self.assertEqual(list(df["tags"]), [["a", "b"], []])
+
+    def test_runs_unmergeable_query_unsliced(self):
+        """Test case to verify queries with count_distinct or count outcomes are never split.
+
+        Asserts:
+            - A truncated count_distinct query is queried once over the whole interval.
+            - Only min, max and array_distinct outcomes are accepted for slicing.
+        """
+        query = self.QUERY.replace("limit: 50", "outcome:\n    $alerts = count_distinct(case.alerts.id)\nlimit: 50")
+        now = int(datetime.now(timezone.utc).timestamp())
+        events = [(str(i), "STAGE_CHANGE", now - 3600 - i) for i in range(200)]
+        chronicle = _FakeChronicle(events, limit=50)
+
+        _, limit_hit, windows = main.fetch_query_time_sliced(chronicle, query, "DAY", 3)
+
+        self.assertTrue(limit_hit)
+        self.assertEqual((windows, chronicle.calls), (1, 1))
+        self.assertFalse(main.can_slice_query("match: $a\noutcome:\n    $n = count($b)\n"))
+        self.assertFalse(main.can_slice_query("match: $a\noutcome:\n    $n = $b\n"))
+        self.assertTrue(main.can_slice_query("match: $a\noutcome:\n    $n = max($b)\n    $t = array_distinct($c)\n"))
+
+    def test_split_window_bounds_are_whole_seconds(self):
+        """Test case to verify split windows are contiguous and start on whole seconds."""
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        windows = main._split_window(start, start + timedelta(seconds=1001), 4)
+
+        self.assertEqual(windows[0][0], start)
+        self.assertEqual(windows[-1][1], start + timedelta(seconds=1001))
+        for (_, previous_end), (next_start, _) in zip(windows, windows[1:]):
+            self.assertEqual(previous_end, next_start)
+            self.assertEqual(next_start.microsecond, 0)
+
+
+class TestCalculateSocMetrics(unittest.TestCase):
+    """Unit test class for calculate_soc_metrics_structured."""
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.db.add(main.Tenant(id=1, name="t", guid="g", region="us", gcp_project_id="p"))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_known_case(self):
+        """Test case to verify the metrics of a single hand-built case."""
+        history = _payload({
+            "case_history_case_id": ["1", "1", "1", "1"],
+            "case_history_case_activity": ["STAGE_CHANGE", "CREATE_CASE", "STAGE_CHANGE", "STATUS_CHANGE"],
+            "case_history_case_event_time": [1300, 1000, 1100, 2000],
+            "case_history_stage": ["Incident", "Triage", "Investigation", "Incident"],
+            "case_history_status": ["OPENED", "OPENED", "OPENED", "CLOSED"],
+        })
+        mttd = _payload({
+            "case_id": ["1"], "created_time": [1000], "min_event_ts": [400],
+            "tags": [["True Positive"]], "environment": [["Default"]],
+            "detection_rule_name": [[]],
+        })
+
+        metrics = main.calculate_soc_metrics_structured(history, mttd, self.db, 1)
+
+        self.assertEqual(metrics["individual_cases"], {
+            "1": {"MTTA": 100, "MTTC": 200, "MTTR": 900, "MTTD": 600,
+                  "tags": ["True Positive"], "environment": "Default",
+                  "detection_rule_name": "Unknown"},
+        })
+        self.assertEqual(metrics["completion_rates"]["total_cases"], 1)
+
+    def test_matches_reference_implementation(self):
+        """Test case to verify the vectorized calculator matches the per-case loop.
+
+        Asserts:
+            Individual, average and completion metrics are identical for recorded
+            payloads using both the default and a custom MTTC/MTTR configuration.
+        """
+        self.db.add_all([
+            main.MTTxConfig(metric_type="MTTC", config_key="case_history_stage", config_value="Investigation", tenant_id=1),
+            main.MTTxConfig(metric_type="MTTR", config_key="case_history_stage", config_value="Incident", tenant_id=1),
+        ])
+        self.db.commit()
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                history, mttd = _recorded_case_data(seed)
+                expected = _reference_metrics(
+                    history, mttd, ("case_history_stage", "Investigation"),
+                    ("case_history_stage", "Incident"))
+                result = main.calculate_soc_metrics_structured(history, mttd, self.db, 1)
+                result.pop("case_dimensions")
+                self.assertEqual(result, expected)
+
+    def test_matches_reference_with_default_config(self):
+        """Test case to verify the default MTTC/MTTR configuration is honoured."""
+        history, mttd = _recorded_case_data(42, num_cases=200)
+        expected = _reference_metrics(
+            history, mttd, ("case_history_stage", "Incident"),
+            ("case_history_status", "CLOSED"))
+        result = main.calculate_soc_metrics_structured(history, mttd, self.db, 1)
+        result.pop("case_dimensions")
+        self.assertEqual(result, expected)
+
+    def test_distribution_metrics(self):
+        """Test case to verify percentiles, extremes and histogram buckets of known values."""
+        values = np.array([60, 120, 600, 4000, 90000, 700000], dtype="float64")
+        result = main.summarize_metrics(values, np.array([]), values, values, 6)
+
+        self.assertEqual(result["average_metrics"]["P50_MTTR_seconds"], 2300)
+        self.assertEqual(result["average_metrics"]["Min_MTTA_seconds"], 60)
+        self.assertEqual(result["average_metrics"]["Max_MTTD_seconds"], 700000)
+        self.assertEqual(result["average_metrics"]["P99_MTTC_seconds"], 0)
+        self.assertEqual([b["count"] for b in result["histograms"]["MTTR"]], [2, 1, 0, 1, 0, 0, 1, 0, 1])
+        self.assertEqual(sum(b["count"] for b in result["histograms"]["MTTC"]), 0)
+
+    def test_no_matching_history(self):
+        """Test case to verify an empty result when no history matches a case."""
+        history = _payload({
+            "case_history_case_id": ["9"], "case_history_case_activity": ["CREATE_CASE"],
+            "case_history_case_event_time": [1], "case_history_stage": ["Triage"],
+            "case_history_status": ["OPENED"],
+        })
+        mttd = _payload({"case_id": ["1"], "created_time": [1], "min_event_ts": [0]})
+        self.assertEqual(
+            main.calculate_soc_metrics_structured(history, mttd, self.db, 1), {})
+
+
+class _FakeTenantChronicle:
+    """Serves both analysis queries from memory for an absolute interval."""
+
+    def __init__(self):
+        self.history = []
+        self.cases = {}
+        self.intervals = []
+
+    def execute_dashboard_query(self, query, interval):
+        window = interval["absoluteTime"]
+        self.intervals.append(window)
+        start, end = (datetime.strptime(window[k], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp() for k in ("startTime", "endTime"))
+        if "case_history" in query:
+            rows = [e for e in self.history if start <= e[2] <= end]
+            return _payload({
+                "case_history_case_id": [r[0] for r in rows], "case_history_case_activity": [r[1] for r in rows],
+                "case_history_case_event_time": [r[2] for r in rows], "case_history_stage": [r[3] for r in rows],
+                "case_history_status": [r[4] for r in rows],
+            })
+        rows = [(case_id, c) for case_id, c in self.cases.items() if start <= c[0] <= end]
+        return self.case_payload(rows)
+
+    def case_payload(self, rows):
+        return _payload({
+            "case_id": [r[0] for r in rows], "created_time": [r[1][0] for r in rows],
+            "min_event_ts": [r[1][1] for r in rows], "tags": [r[1][2] for r in rows],
+            "environment": [["Default"] for _ in rows], "detection_rule_name": [["rule_a"] for _ in rows],
+        })
+
+    def full_payloads(self, since=0):
+        history = [e for e in self.history if e[2] >= since]
+        return (_payload({
+            "case_history_case_id": [r[0] for r in history], "case_history_case_activity": [r[1] for r in history],
+            "case_history_case_event_time": [r[2] for r in history], "case_history_stage": [r[3] for r in history],
+            "case_history_status": [r[4] for r in history],
+        }), self.case_payload(list(self.cases.items())))
+
+
+class TestIncrementalMetricStore(unittest.TestCase):
+    """Unit test class for the incremental case metric store."""
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.tenant = main.Tenant(id=1, name="t", guid="g", region="us", gcp_project_id="p")
+        self.db.add(self.tenant)
+        self.db.commit()
+        self.chronicle = _FakeTenantChronicle()
+        client = mock.Mock()
+        client.chronicle.return_value = self.chronicle
+        for patcher in (mock.patch.object(main, "SecOpsClient", return_value=client, create=True), mock.patch.object(main, "_secops_client", None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        main.invalidate_chronicle_client(1)
+        self.addCleanup(main.invalidate_chronicle_client, 1)
+
+    def tearDown(self):
+        self.db.close()
+
+    def run_incremental(self, time_unit, start_time_val):
+        return main.run_incremental_analysis(self.tenant, time_unit, start_time_val, self.db, main.load_tenant_context(1, self.db))
+
+    def add_case(self, case_id, created, tags):
+        self.chronicle.cases[case_id] = (created, created - 900, tags)
+        self.chronicle.history.append((case_id, "CREATE_CASE", created, "Triage", "OPENED"))
+
+    def test_incremental_run_matches_full_calculation(self):
+        """Test case to verify a delta run produces the same metrics as a full calculation.
+
+        Asserts:
+          The second run only queries history after the watermark, and the metrics
+          rebuilt from the store equal calculate_soc_metrics_structured over all data.
+        """
+        now = int(datetime.now(timezone.utc).timestamp())
+        self.add_case("1", now - 80000, ["True Positive"])
+        self.add_case("2", now - 60000, [])
+        self.chronicle.history += [
+            ("1", "STAGE_CHANGE", now - 79000, "Investigation", "OPENED"),
+            ("1", "STAGE_CHANGE", now - 70000, "Incident", "OPENED"),
+            ("2", "STAGE_CHANGE", now - 59500, "Investigation", "OPENED"),
+        ]
+
+        first = self.run_incremental("DAY", 2)
+        self.assertEqual(first["individual_cases"]["1"]["MTTR"], "-")
+
+        # New activity arrives: case 1 closes, case 2 is contained and a new case is opened.
+        self.chronicle.intervals.clear()
+        self.chronicle.history += [
+            ("1", "STATUS_CHANGE", now - 20, "Incident", "CLOSED"),
+            ("2", "STAGE_CHANGE", now - 15, "Incident", "OPENED"),
+        ]
+        self.add_case("3", now - 10, ["FP"])
+        self.chronicle.history.append(("3", "STAGE_CHANGE", now - 5, "Investigation", "OPENED"))
+
+        second = self.run_incremental("DAY", 2)
+
+        watermark = self.db.query(main.CaseMetricWatermark).one()
+        earliest_fetch = min(datetime.strptime(i["startTime"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp() for i in self.chronicle.intervals)
+        self.assertGreaterEqual(earliest_fetch, watermark.fetched_until - main.WATERMARK_OVERLAP_SECONDS - 60)
+        history, cases = self.chronicle.full_payloads()
+        self.assertEqual(second, main.calculate_soc_metrics_structured(history, cases, self.db, 1))
+        self.assertEqual(second["completion_rates"]["total_cases"], 3)
+
+    def test_config_change_rebuilds_store(self):
+        """Test case to verify a changed MTTR configuration discards the stored metrics."""
+        now = int(datetime.now(timezone.utc).timestamp())
+        self.add_case("1", now - 1000, [])
+        self.chronicle.history.append(("1", "STAGE_CHANGE", now - 900, "Incident", "CLOSED"))
+        self.run_incremental("DAY", 1)
+        signature = self.db.query(main.CaseMetricWatermark).one().signature
+
+        self.db.add(main.MTTxConfig(metric_type="MTTR", config_key="case_history_stage", config_value="Incident", tenant_id=1))
+        self.db.commit()
+        metrics = self.run_incremental("DAY", 1)
+
+        self.assertNotEqual(self.db.query(main.CaseMetricWatermark).one().signature, signature)
+        self.assertEqual(metrics["individual_cases"]["1"]["MTTR"], 0)
+
+    def test_late_create_case_sets_first_action(self):
+        """Test case to verify a CREATE_CASE fetched after the case's stage changes still yields MTTA."""
+        now = int(datetime.now(timezone.utc).timestamp())
+        self.chronicle.cases["1"] = (now - 2000, now - 2500, [])
+        self.chronicle.history.append(("1", "STAGE_CHANGE", now - 1500, "Investigation", "OPENED"))
+        first = self.run_incremental("DAY", 1)
+        self.assertNotIn("1", first["individual_cases"])
+
+        self.chronicle.history.append(("1", "CREATE_CASE", now - 2000, "Triage", "OPENED"))
+        with mock.patch.object(main, "WATERMARK_OVERLAP_SECONDS", 3000):
+            second = self.run_incremental("DAY", 1)
+
+        self.assertEqual(second["individual_cases"]["1"]["MTTA"], 500)
+        history, cases = self.chronicle.full_payloads()
+        self.assertEqual(second, main.calculate_soc_metrics_structured(history, cases, self.db, 1))
+
+    def test_shorter_window_ignores_earlier_milestones(self):
+        """Test case to verify a shorter window only uses the stored events inside it.
+
+        Asserts:
+          A case created before the window counts towards the total but is skipped, and the
+          result equals a calculation over the history inside the window. The longer window
+          keeps the store from being rebuilt.
+        """
+        now = int(datetime.now(timezone.utc).timestamp())
+        self.add_case("1", now - 150000, ["TP"])
+        self.chronicle.history.append(("1", "STAGE_CHANGE", now - 1000, "Investigation", "OPENED"))
+        self.add_case("2", now - 30000, [])
+        self.chronicle.history += [
+            ("2", "STAGE_CHANGE", now - 29000, "Investigation", "OPENED"),
+            ("2", "STAGE_CHANGE", now - 28000, "Incident", "OPENED"),
+        ]
+        self.run_incremental("DAY", 2)
+
+        metrics = self.run_incremental("HOUR", 10)
+
+        self.assertEqual(self.db.query(main.CaseMetricWatermark).one().window_seconds, 2 * 86400)
+        self.assertEqual(metrics["completion_rates"]["total_cases"], 2)
+        self.assertNotIn("1", metrics["individual_cases"])
+        self.assertEqual(metrics["individual_cases"]["2"]["MTTC"], 1000)
+        history, cases = self.chronicle.full_payloads(since=now - 36000)
+        self.assertEqual(metrics, main.calculate_soc_metrics_structured(history, cases, self.db, 1))
+
+    def test_merges_case_context_and_prunes_old_cases(self):
+        """Test case to verify tags accumulate across fetches and cases older than the longest window are pruned."""
+        now = int(datetime.now(timezone.utc).timestamp())
+        self.add_case("1", now - 150000, ["TP"])
+        self.add_case("2", now - 1000, ["FP"])
+        self.run_incremental("DAY", 2)
+
+        self.chronicle.cases["2"] = (now - 1000, now - 1900, ["Escalated"])
+        metrics = self.run_incremental("DAY", 2)
+        self.assertEqual(metrics["individual_cases"]["2"]["tags"], ["FP", "Escalated"])
+        self.assertEqual(metrics["individual_cases"]["2"]["environment"], "Default")
+
+        watermark = self.db.query(main.CaseMetricWatermark).one()
+        pruned = main.prune_case_metric_store(1, watermark, now + 86400, self.db)
+        self.assertEqual(pruned, 1)
+        self.assertEqual([r.case_id for r in self.db.query(main.CaseMetric)], ["2"])
+        self.assertEqual(watermark.coverage_start, now + 86400 - 2 * 86400)
+
+
+class TestPerformAnalysis(unittest.TestCase):
+    """Unit test class for the analysis query fetch."""
+
+    def test_runs_queries_concurrently(self):
+        """Test case to verify the core and additional queries are fetched side by side.
+
+        Asserts:
+          All three queries are in flight at once, additional query results are
+          returned separately and every query reports its timing.
+        """
+        engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        tenant = main.Tenant(id=88, name="t", guid="g", region="us", gcp_project_id="p")
+        db.add(tenant)
+        db.commit()
+        main.get_queries(88, db)
+        main.create_query(88, main.QueryConfigCreate(name="query_alerts", query_text="alerts\nlimit: 10"), db)
+
+        barrier = threading.Barrier(3, timeout=5)
+
+        def fake_query(query, interval):
+            # Only returns once all three queries are running.
+            barrier.wait()
+            return _payload({"n": [1]})
+
+        chronicle = mock.Mock()
+        chronicle.execute_dashboard_query.side_effect = fake_query
+        with mock.patch.object(main, "SECOPS_SDK_AVAILABLE", True), \
+                mock.patch.object(main, "get_chronicle_client", return_value=chronicle):
+            result = main.perform_analysis(88, "DAY", 1, db, time_sliced=False)
+        db.close()
+
+        self.assertEqual(chronicle.execute_dashboard_query.call_count, 3)
+        self.assertEqual(list(result["additional_query_data"]), ["query_alerts"])
+        self.assertFalse(result["additional_limit_hits"]["query_alerts"])
+        self.assertEqual(set(result["query_timings"]), {"query_history", "query_case", "query_alerts"})
+        self.assertEqual(result["query_timings"]["query_case"]["rows"], 1)
+
+
+class TestAnalysisResultCache(unittest.TestCase):
+    """Unit test class for the analysis result cache."""
+
+    def setUp(self):
+        handle, self.cache_path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.addCleanup(os.remove, self.cache_path)
+        for patcher in (mock.patch.object(main, "_analysis_cache", OrderedDict()), mock.patch.object(main, "ANALYSIS_CACHE_PATH", self.cache_path)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_memory_and_disk_tiers(self):
+        """Test case to verify LRU eviction, disk fallback and per-tenant invalidation."""
+        with mock.patch.object(main, "ANALYSIS_CACHE_SIZE", 2):
+            for name in ("a", "b", "c"):
+                main.cache_analysis_result(name, 1 if name != "c" else 2, {"name": name})
+            self.assertNotIn("a", main._analysis_cache)
+            self.assertEqual(main.get_cached_analysis("c")[:2], ({"name": "c"}, "memory"))
+            self.assertEqual(main.get_cached_analysis("a")[:2], ({"name": "a"}, "disk"))
+            self.assertEqual(main.get_cached_analysis("a")[1], "memory")
+
+            main.invalidate_analysis_cache(1)
+            self.assertEqual(main.get_cached_analysis("a"), (None, None, None))
+            self.assertEqual(main.get_cached_analysis("b"), (None, None, None))
+            self.assertEqual(main.get_cached_analysis("c")[0], {"name": "c"})
+
+    def test_run_analysis_served_from_cache(self):
+        """Test case to verify repeated runs are cached until the tenant's queries change.
+
+        Asserts:
+          The second identical run is a cache hit that does not query SecOps, and
+          updating a query invalidates the cached result.
+        """
+        engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        db.add(main.Tenant(id=5, name="t", guid="g", region="us", gcp_project_id="p"))
+        db.commit()
+        request = main.AnalysisRequest(tenant_id=5, time_unit="DAY", start_time_val=7)
+
+        result = {"case_history_data": _payload({"n": [1, 2]}), "case_mttd_data": _payload({"n": [1]}), "history_limit_hit": False, "mttd_limit_hit": False}
+        with mock.patch.object(main, "perform_analysis", return_value=result) as perform_analysis:
+            first, second = Response(), Response()
+            self.assertEqual(main.run_analysis(request, first, db)["history_rows"], 2)
+            self.assertEqual(main.run_analysis(request, second, db)["history_rows"], 2)
+            self.assertEqual(first.headers["X-MTTx-Cache"], "MISS")
+            self.assertEqual(second.headers["X-MTTx-Cache"], "HIT")
+            self.assertEqual(second.headers["X-MTTx-Cache-Tier"], "memory")
+            self.assertEqual(perform_analysis.call_count, 1)
+
+            query = db.query(main.QueryConfig).filter(main.QueryConfig.name == "query_case").one()
+            main.update_query(query.id, main.QueryConfigUpdate(query_text=query.query_text), db)
+            third = Response()
+            main.run_analysis(request, third, db)
+            self.assertEqual(third.headers["X-MTTx-Cache"], "MISS")
+            self.assertEqual(perform_analysis.call_count, 2)
+        db.close()
+
+
+    def test_calculate_from_session(self):
+        """Test case to verify /analysis/calculate works from a run's session ID.
+
+        Asserts:
+          The run returns only a summary, calculating from its session matches
+          calculating from the raw payloads, and unknown or foreign sessions are rejected.
+        """
+        engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        db.add(main.Tenant(id=6, name="t", guid="g", region="us", gcp_project_id="p"))
+        db.commit()
+        history, cases = _recorded_case_data(3, 20)
+        result = {"case_history_data": history, "case_mttd_data": cases, "history_limit_hit": True, "mttd_limit_hit": False}
+
+        with mock.patch.object(main, "perform_analysis", return_value=result):
+            summary = main.run_analysis(main.AnalysisRequest(tenant_id=6, time_unit="DAY", start_time_val=1), Response(), db)
+        self.assertNotIn("case_history_data", summary)
+        self.assertEqual(summary["mttd_rows"], main.get_result_row_count(cases))
+
+        from_session = main.calculate_metrics(main.CalculationRequest(tenant_id=6, session_id=summary["session_id"]), Response(), db)
+        from_payload = main.calculate_metrics(main.CalculationRequest(tenant_id=6, case_history_data=history, case_mttd_data=cases, history_limit_hit=True), Response(), db)
+        self.assertEqual(from_session, from_payload)
+        self.assertTrue(from_session["history_limit_hit"])
+
+        with self.assertRaises(main.HTTPException) as raised:
+            main.calculate_metrics(main.CalculationRequest(tenant_id=6, session_id="missing"), Response(), db)
+        self.assertEqual(raised.exception.status_code, 404)
+        db.add(main.Tenant(id=7, name="other", guid="g7", region="us", gcp_project_id="p"))
+        db.commit()
+        with self.assertRaises(main.HTTPException) as raised:
+            main.calculate_metrics(main.CalculationRequest(tenant_id=7, session_id=summary["session_id"]), Response(), db)
+        self.assertEqual(raised.exception.status_code, 400)
+        db.close()
+
+
+def _api_error(code):
+    """An error like the SecOps SDK raises, with the API's error body in its message."""
+    return RuntimeError(f'Failed to call the API: {{"error": {{"code": {code}, "message": "error {code}"}}}}')
+
+
+class _FakeDataTables:
+    """Keeps Data Table rows in memory; create_data_table_rows fails with `failure_code` for the first `failures` calls."""
+
+    def __init__(self, tables=None, failures=0, failure_code=429):
+        self.tables = tables or {}
+        self.failures = failures
+        self.failure_code = failure_code
+        self.calls = []
+
+    def get_data_table(self, name):
+        if name not in self.tables:
+            raise _api_error(404)
+        return {"name": name}
+
+    def create_data_table(self, name, description, header, column_options=None):
+        self.tables[name] = []
+
+    def list_data_table_rows(self, name):
+        return [{"name": f"{name}/rows/{i}", "values": values} for i, values in enumerate(self.tables[name])]
+
+    def create_data_table_rows(self, name, rows):
+        self.calls.append(("create", len(rows)))
+        if self.failures:
+            self.failures -= 1
+            raise _api_error(self.failure_code)
+        self.tables[name].extend(rows)
+
+    def update_data_table_rows(self, name, row_updates):
+        self.calls.append(("update", len(row_updates)))
+        for update in row_updates:
+            self.tables[name][int(update["name"].rsplit("/", 1)[1])] = update["values"]
+
+
+class TestDataTableExport(unittest.TestCase):
+    """Unit test class for the chunked Data Table exporter."""
+
+    header = {"case_id": "STRING", "MTTR": "NUMBER"}
+
+    def setUp(self):
+        for patcher in (mock.patch.object(main, "DATA_TABLE_CHUNK_MAX_ROWS", 2), mock.patch.object(main, "DATA_TABLE_RETRY_BASE_SECONDS", 0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_upserts_on_key_column_in_chunks(self):
+        """Test case to verify existing keys are updated, new keys appended and chunks retried.
+
+        Asserts:
+          Re-exported cases replace their rows instead of duplicating them, each
+          chunk respects the row limit and a transient failure is retried.
+        """
+        chronicle = _FakeDataTables({"t": [["1", "10"], ["2", "20"]]}, failures=1)
+        rows = [["1", "11"], ["3", "30"], ["4", "40"], ["5", "50"]]
+        reports = main.export_data_table_rows(chronicle, "t", "d", self.header, rows, key_column="case_id")
+
+        self.assertEqual(sorted(chronicle.tables["t"]), [["1", "11"], ["2", "20"], ["3", "30"], ["4", "40"], ["5", "50"]])
+        self.assertEqual([(r["operation"], r["rows"], r["attempts"]) for r in reports], [("update", 1, 1), ("create", 2, 2), ("create", 1, 1)])
+        self.assertTrue(all(r["status"] == "success" for r in reports))
+
+    def test_creates_table_and_reports_failed_chunks(self):
+        """Test case to verify a missing table is created and a chunk that keeps failing is reported."""
+        chronicle = _FakeDataTables(failures=main.DATA_TABLE_RETRY_ATTEMPTS)
+        reports = main.export_data_table_rows(chronicle, "new", "d", self.header, [["1", "1"], ["2", "2"], ["3", "3"]], key_column="case_id")
+
+        self.assertEqual([r["status"] for r in reports], ["failed", "success"])
+        self.assertEqual(chronicle.tables["new"], [["3", "3"]])
+
+    def test_client_errors_are_not_retried(self):
+        """Test case to verify a rejected chunk fails without retries and a failed table lookup creates no table."""
+        chronicle = _FakeDataTables({"t": []}, failures=1, failure_code=400)
+        reports = main.export_data_table_rows(chronicle, "t", "d", self.header, [["1", "1"]])
+        self.assertEqual([(r["status"], r["attempts"]) for r in reports], [("failed", 1)])
+        self.assertEqual(chronicle.calls, [("create", 1)])
+
+        chronicle = _FakeDataTables()
+        with mock.patch.object(chronicle, "get_data_table", side_effect=_api_error(403)), \
+                mock.patch.object(chronicle, "create_data_table") as create, self.assertRaises(RuntimeError):
+            main.export_data_table_rows(chronicle, "t", "d", self.header, [["1", "1"]])
+        create.assert_not_called()
+
+    def test_chunks_by_payload_size(self):
+        """Test case to verify chunks are split before exceeding the request size."""
+        rows = [["x" * 100]] * 5
+        with mock.patch.object(main, "DATA_TABLE_CHUNK_MAX_ROWS", 100), \
+                mock.patch.object(main, "DATA_TABLE_CHUNK_MAX_BYTES", 300):
+            chunks = main.chunk_data_table_rows(rows)
+        self.assertEqual([len(c) for c in chunks], [2, 2, 1])
+
+
+class TestPartitionedExport(unittest.TestCase):
+    """Unit test class for the partitioned Parquet and gzip CSV destinations."""
+
+    output = {
+        "average_metrics": {"Average_MTTA_seconds": 10, "Average_MTTC_seconds": 0, "Average_MTTR_seconds": 30, "Average_MTTD_seconds": 5},
+        "individual_cases": {
+            "1": {"MTTA": 10, "MTTC": "-", "MTTR": 30, "MTTD": 5, "tags": ["TP", "Phish"], "environment": "Prod", "detection_rule_name": "r1"},
+            "2": {"MTTA": "-", "MTTC": "-", "MTTR": "-", "MTTD": "-", "tags": [], "environment": "Dev", "detection_rule_name": "Unknown"},
+            "3": {"MTTA": 7, "MTTC": 8, "MTTR": 9, "MTTD": 1, "tags": ["FP"], "environment": "Prod", "detection_rule_name": "r2"},
+        }
+    }
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.tenant = main.Tenant(id=3, name="acme")
+
+    def export_two_days(self, destination_type):
+        for day in (1, 2):
+            export_time = datetime(2024, 5, day, 6, 0, tzinfo=timezone.utc)
+            written = main.write_partitioned_export(destination_type, self.root, self.tenant, 9, self.output, export_time)
+            self.assertEqual(written, {"average_metrics": 1, "individual_cases": 3})
+
+    def assert_history(self):
+        averages = main.read_metric_history(self.root, 3, "average_metrics", date(2024, 5, 1), date(2024, 5, 2))
+        self.assertEqual(averages["Average_MTTR_seconds"].tolist(), [30, 30])
+        self.assertEqual(averages["export_datetime"].tolist(), ["2024-05-01T06:00:00+00:00", "2024-05-02T06:00:00+00:00"])
+
+        cases = main.read_metric_history(self.root, 3, "individual_cases", date(2024, 5, 2), date(2024, 5, 31))
+        self.assertEqual(cases["case_id"].tolist(), ["1", "2", "3"])
+        self.assertTrue(pd.isna(cases["MTTA"][1]))
+        self.assertEqual(cases["MTTR"][2], 9)
+        self.assertTrue(main.read_metric_history(self.root, 3, "completion_rates", date(2024, 5, 1), date(2024, 5, 2)).empty)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, "tenant=3"))), ["date=2024-05-01", "date=2024-05-02"])
+
+    def test_gzip_csv_round_trip(self):
+        """Test case to verify gzip CSV exports append per date and are read back by range."""
+        self.export_two_days("CSV_GZ")
+        self.assert_history()
+
+    @unittest.skipUnless(main.PYARROW_AVAILABLE, "pyarrow not installed")
+    def test_parquet_round_trip_in_row_groups(self):
+        """Test case to verify Parquet exports are written one row group per batch.
+
+        Asserts:
+          With a batch size of 2 the case file holds two row groups, and the
+          rows, including list tags, read back unchanged.
+        """
+        with mock.patch.object(main, "EXPORT_ROW_GROUP_SIZE", 2):
+            self.export_two_days("PARQUET")
+        self.assert_history()
+
+        partition = os.path.join(self.root, "tenant=3", "date=2024-05-01")
+        case_file = next(name for name in os.listdir(partition) if name.startswith("individual_cases-"))
+        self.assertEqual(main.pq.ParquetFile(os.path.join(partition, case_file)).num_row_groups, 2)
+        cases = main.read_metric_history(self.root, 3, "individual_cases", date(2024, 5, 1), date(2024, 5, 1))
+        self.assertEqual(list(cases["tags"][0]), ["TP", "Phish"])
+
+
+class TestMetricThresholds(unittest.TestCase):
+    """Unit test class for percentile thresholds and the column migration."""
+
+    def test_adds_statistic_column_to_existing_table(self):
+        """Test case to verify thresholds created before the statistic column gain it on startup."""
+        engine = create_engine("sqlite://")
+        with engine.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE metric_thresholds (id INTEGER PRIMARY KEY, tenant_id INTEGER, metric_name VARCHAR, good_threshold INTEGER, ok_threshold INTEGER, good_color VARCHAR, ok_color VARCHAR, bad_color VARCHAR)")
+            conn.exec_driver_sql("INSERT INTO metric_thresholds VALUES (1, 1, 'MTTR', 1, 2, 'a', 'b', 'c')")
+        main.add_missing_columns(engine)
+        main.add_missing_columns(engine)
+        db = sessionmaker(bind=engine)()
+        self.assertEqual(db.query(main.MetricThreshold).one().statistic, "mean")
+        db.close()
+
+    def test_percentile_statistic_only_for_time_metrics(self):
+        """Test case to verify percentile statistics are stored for time metrics and rejected otherwise."""
+        engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        main.get_thresholds(1, db)
+        colors = {"good_color": "#0f0", "ok_color": "#ff0", "bad_color": "#f00"}
+
+        updated = main.bulk_update_thresholds(1, main.BulkThresholdUpdate(thresholds=[
+            main.MetricThresholdBase(metric_name="MTTR", good_threshold=3600, ok_threshold=7200, statistic="p90", **colors)
+        ]), db)
+        self.assertEqual(updated[0].statistic, "p90")
+        with self.assertRaises(main.HTTPException):
+            main.bulk_update_thresholds(1, main.BulkThresholdUpdate(thresholds=[
+                main.MetricThresholdBase(metric_name="MTTA", good_threshold=1, ok_threshold=2, statistic="p50", **colors),
+                main.MetricThresholdBase(metric_name="MTTR_completion_percent", good_threshold=90, ok_threshold=75, statistic="p50", **colors)
+            ]), db)
+        mtta = db.query(main.MetricThreshold).filter_by(tenant_id=1, metric_name="MTTA").one()
+        self.assertEqual(mtta.statistic, "mean")
+        self.assertNotIn(mtta, db.dirty)
+        with self.assertRaises(ValueError):
+            main.MetricThresholdBase(metric_name="MTTR", good_threshold=1, ok_threshold=2, statistic="p42", **colors)
+        db.close()
+
+
+class TestMetricBreakdown(unittest.TestCase):
+    """Unit test class for the per environment, rule and tag breakdown."""
+
+    cases = {
+        "1": {"MTTA": 10, "MTTC": "-", "MTTR": 30, "MTTD": 5, "tags": ["TP", "Phish"], "environment": "Prod", "detection_rule_name": "r1, r2"},
+        "2": {"MTTA": "-", "MTTC": "-", "MTTR": "-", "MTTD": "-", "tags": [], "environment": "Dev", "detection_rule_name": "Unknown"},
+        "3": {"MTTA": 20, "MTTC": 8, "MTTR": 90, "MTTD": 1, "tags": ["TP"], "environment": "Prod", "detection_rule_name": "r2"},
+    }
+    case_dimensions = {
+        "1": {"environment": ["Prod"], "detection_rule_name": ["r1", "r2"]},
+        "2": {"environment": ["Dev"], "detection_rule_name": []},
+        "3": {"environment": ["Prod"], "detection_rule_name": ["r2"]},
+    }
+
+    def test_known_cases(self):
+        """Test case to verify list-valued fields are exploded and empty groups are labelled."""
+        records = main.breakdown_records(main.compute_metric_breakdown(self.cases, case_dimensions=self.case_dimensions))
+        groups = {(r["dimension"], r["value"]): r for r in records}
+
+        self.assertEqual(set(groups), {
+            ("environment", "Prod"), ("environment", "Dev"), ("detection_rule_name", "r1"), ("detection_rule_name", "r2"),
+            ("detection_rule_name", "Unknown"), ("tags", "TP"), ("tags", "Phish"), ("tags", "Untagged")})
+        self.assertEqual(groups[("tags", "TP")]["total_cases"], 2)
+        self.assertEqual(groups[("tags", "TP")]["MTTR_average_seconds"], 60)
+        self.assertEqual(groups[("tags", "TP")]["MTTR_p50_seconds"], 60)
+        self.assertEqual(groups[("tags", "TP")]["MTTC_completion_percent"], 50.0)
+        self.assertEqual(groups[("detection_rule_name", "r2")]["total_cases"], 2)
+        self.assertIsNone(groups[("environment", "Dev")]["MTTA_average_seconds"])
+        self.assertEqual(groups[("environment", "Dev")]["MTTA_completion_percent"], 0.0)
+
+        by_mttr = main.compute_metric_breakdown(self.cases, ("tags",), min_cases=1, sort_by="MTTR")
+        self.assertEqual(by_mttr["value"].tolist(), ["TP", "Phish", "Untagged"])
+        self.assertEqual(main.compute_metric_breakdown(self.cases, min_cases=2, case_dimensions=self.case_dimensions)["value"].tolist(), ["r2", "Prod", "TP"])
+
+    def test_names_containing_commas(self):
+        """Test case to verify environment and rule names with commas are grouped whole.
+
+        Asserts:
+            The calculator keeps each case's original name lists, so a rule called
+            "Logon, failed" is one group next to "r2" rather than being split.
+        """
+        engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        history = _payload({
+            "case_history_case_id": ["1", "1", "2"], "case_history_case_activity": ["CREATE_CASE", "STAGE_CHANGE", "CREATE_CASE"],
+            "case_history_case_event_time": [100, 160, 200], "case_history_stage": ["Triage", "Incident", "Triage"],
+            "case_history_status": ["OPENED", "OPENED", "OPENED"],
+        })
+        mttd = _payload({
+            "case_id": ["1", "2"], "created_time": [100, 200], "min_event_ts": [50, 150], "tags": [[], []],
+            "environment": [["Prod, EU"], ["Dev"]], "detection_rule_name": [["Logon, failed", "r2"], ["r2"]],
+        })
+        metrics = main.calculate_soc_metrics_structured(history, mttd, db, 1)
+        db.close()
+
+        self.assertEqual(metrics["individual_cases"]["1"]["detection_rule_name"], "Logon, failed, r2")
+        frame = main.compute_metric_breakdown(metrics["individual_cases"], ("environment", "detection_rule_name"), case_dimensions=metrics["case_dimensions"])
+        groups = dict(zip(zip(frame["dimension"], frame["value"]), frame["total_cases"]))
+        self.assertEqual(groups, {
+            ("environment", "Prod, EU"): 1, ("environment", "Dev"): 1,
+            ("detection_rule_name", "Logon, failed"): 1, ("detection_rule_name", "r2"): 2})
+
+    def test_matches_per_group_loop(self):
+        """Test case to verify the single groupby matches filtering the cases group by group."""
+        engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        history, mttd = _recorded_case_data(11, num_cases=150)
+        metrics = main.calculate_soc_metrics_structured(history, mttd, db, 1)
+        individual_cases, case_dimensions = metrics["individual_cases"], metrics["case_dimensions"]
+        db.close()
+
+        for record in main.breakdown_records(main.compute_metric_breakdown(individual_cases, case_dimensions=case_dimensions)):
+            if record["dimension"] == "tags":
+                members = [c for c in individual_cases.values() if record["value"] in (c["tags"] or ["Untagged"])]
+            else:
+                members = [c for case_id, c in individual_cases.items() if record["value"] in (case_dimensions[case_id][record["dimension"]] or ["Unknown"])]
+            self.assertEqual(record["total_cases"], len(members))
+            for metric in main.CASE_METRIC_NAMES:
+                values = [c[metric] for c in members if c[metric] != "-"]
+                self.assertEqual(record[f"{metric}_completion_percent"], round(len(values) / len(members) * 100, 2))
+                if values:
+                    self.assertEqual(record[f"{metric}_average_seconds"], round(np.mean(values)))
+                    self.assertEqual(record[f"{metric}_p90_seconds"], round(np.percentile(values, 90)))
+
+    def test_breakdown_endpoint(self):
+        """Test case to verify /analysis/breakdown groups the cases of an analysis session."""
+        engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        db.add(main.Tenant(id=8, name="t", guid="g8", region="us", gcp_project_id="p"))
+        db.commit()
+        history, cases = _recorded_case_data(4, 30)
+        result = {"case_history_data": history, "case_mttd_data": cases, "history_limit_hit": False, "mttd_limit_hit": False}
+        with mock.patch.object(main, "_analysis_cache", OrderedDict()), mock.patch.object(main, "perform_analysis", return_value=result):
+            summary = main.run_analysis(main.AnalysisRequest(tenant_id=8, time_unit="DAY", start_time_val=1), Response(), db)
+            response = main.calculate_breakdown(main.BreakdownRequest(tenant_id=8, session_id=summary["session_id"], dimensions=["environment"]), Response(), db)
+
+        self.assertEqual(list(response["breakdown"]), ["environment"])
+        # Cases in several environments count once per environment
+        self.assertGreaterEqual(sum(r["total_cases"] for r in response["breakdown"]["environment"]), response["total_cases"])
+        with self.assertRaises(ValueError):
+            main.BreakdownRequest(tenant_id=8, session_id="s", dimensions=["severity"])
+        with self.assertRaises(ValueError):
+            main.BreakdownRequest(tenant_id=8, session_id="s", sort_by="MTTX")
+        db.close()
+
+
+class TestBenchmarkGenerator(unittest.TestCase):
+    """Unit test class for the synthetic payload generator used by benchmark.py."""
+
+    def test_generates_requested_cases_and_mixes(self):
+        """Test case to verify event counts, stage mixes and that the calculator accepts the payloads."""
+        history, mttd = benchmark.generate_case_payloads(50, events_per_case=4, stage_mix={"Incident": 1}, status_mix={"CLOSED": 1})
+        df_history = main.json_to_dataframe(history)
+        self.assertEqual(len(df_history), 200)
+        self.assertEqual(df_history.groupby("case_history_case_id").size().unique().tolist(), [4])
+        self.assertEqual((df_history["case_history_case_activity"] == "CREATE_CASE").sum(), 50)
+        self.assertEqual(set(df_history["case_history_stage"]), {"Triage", "Incident"})
+
+        engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        metrics = main.calculate_soc_metrics_structured(history, mttd, db, 1)
+        db.close()
+        self.assertEqual(metrics["completion_rates"]["total_cases"], 50)
+        # Every event after creation is CLOSED, so each acknowledged case is also resolved
+        rates = metrics["completion_rates"]
+        self.assertGreater(rates["MTTA_completion_percent"], 0)
+        self.assertEqual(rates["MTTR_completion_percent"], rates["MTTA_completion_percent"])
+
+    def test_compare_results_flags_regressions(self):
+        """Test case to verify only measurements beyond the tolerance are reported."""
+        baseline = [{"events": 1000, "parse_seconds": 1.0, "parse_peak_mb": 10, "calculate_seconds": 2.0, "calculate_peak_mb": 10}]
+        results = [{"events": 1000, "parse_seconds": 1.1, "parse_peak_mb": 10, "calculate_seconds": 3.0, "calculate_peak_mb": 9}]
+        self.assertEqual(benchmark.compare_results(results, baseline, 0.2), ["1000 events: calculate_seconds 2.0 -> 3.0"])
+
+
+class TestDatabaseEngine(unittest.TestCase):
+    """Unit test class for the SQLite engine configuration and index migration."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.engine = main.create_database_engine(f"sqlite:///{os.path.join(self.directory, 'mttx.db')}")
+        self.addCleanup(self.engine.dispose)
+        main.Base.metadata.create_all(bind=self.engine)
+
+    def test_reads_and_writes_do_not_fail_on_locks(self):
+        """Test case to verify WAL lets readers through a pending write and writers wait for the lock.
+
+        Asserts:
+          A read completes while another connection holds an uncommitted write, and a
+          second write blocks until the first commits instead of raising "database is locked".
+        """
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("PRAGMA journal_mode").scalar(), "wal")
+            self.assertEqual(conn.exec_driver_sql("PRAGMA busy_timeout").scalar(), main.SQLITE_BUSY_TIMEOUT_MS)
+
+        Session = sessionmaker(bind=self.engine)
+        writer = Session()
+        writer.add(main.Tenant(name="a", guid="a", region="us", gcp_project_id="p"))
+        writer.flush()
+
+        second_write = {}
+        def write_second():
+            with Session() as db:
+                db.add(main.Tenant(name="b", guid="b", region="us", gcp_project_id="p"))
+                db.commit()
+                second_write["done"] = time.monotonic()
+        thread = threading.Thread(target=write_second)
+        thread.start()
+
+        with Session() as reader:
+            self.assertEqual(reader.query(main.Tenant).count(), 0)
+        time.sleep(0.2)
+        committed = time.monotonic()
+        writer.commit()
+        writer.close()
+        thread.join(timeout=10)
+
+        self.assertGreater(second_write["done"], committed)
+        with Session() as reader:
+            self.assertEqual(reader.query(main.Tenant).count(), 2)
+
+    def test_creates_indexes_on_existing_tables(self):
+        """Test case to verify indexes added to a model are created on databases that predate them."""
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_query_configs_tenant_name")
+        main.create_missing_indexes(self.engine)
+        main.create_missing_indexes(self.engine)
+        self.assertIn("ix_query_configs_tenant_name", {i["name"] for i in main.inspect(self.engine).get_indexes("query_configs")})
+
+
+class TestTenantRunContext(unittest.TestCase):
+    """Unit test class for the cached, eager-loaded tenant run context."""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        main.Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add(main.Tenant(id=21, name="t", guid="g21", region="us", gcp_project_id="p"))
+        for schedule_id in (1, 2, 3):
+            self.db.add(main.Schedule(id=schedule_id, tenant_id=21, cron_schedule="0 * * * *"))
+            self.db.add_all([main.ScheduleDestination(schedule_id=schedule_id, path=f"/tmp/{schedule_id}-{i}.csv") for i in range(2)])
+        self.db.commit()
+        main.get_queries(21, self.db)
+        main.get_mttx_configs(21, self.db)
+        main.get_thresholds(21, self.db)
+        patcher = mock.patch.object(main, "_tenant_contexts", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.statements = []
+        main.event.listen(self.engine, "before_cursor_execute", self.count_statement)
+
+    def tearDown(self):
+        self.db.close()
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def test_loads_once_until_invalidated(self):
+        """Test case to verify the context is loaded in one statement per relationship and reused.
+
+        Asserts:
+          Loading issues one SELECT each for the tenant, queries, configs, thresholds,
+          schedules and destinations, a second lookup issues none, and updating a
+          schedule reloads the context with the change.
+        """
+        context = main.get_tenant_context(21, self.db)
+        self.assertEqual(len(self.statements), 6)
+        self.assertEqual(set(context.queries), set(main.CORE_QUERY_NAMES))
+        self.assertEqual(context.mttr_config.config_value, "CLOSED")
+        self.assertEqual(len(context.thresholds), 8)
+        self.assertEqual(sum(len(s.destinations) for s in context.schedules.values()), 6)
+
+        self.statements.clear()
+        self.assertIs(main.get_tenant_context(21, self.db), context)
+        self.assertEqual(self.statements, [])
+
+        main.update_schedule(2, main.ScheduleUpdate(cron_schedule="0 * * * *", is_enabled=False), self.db)
+        reloaded = main.get_tenant_context(21, self.db)
+        self.assertIsNot(reloaded, context)
+        self.assertFalse(reloaded.schedules[2].is_enabled)
+        self.assertIsNone(main.get_tenant_context(99, self.db))
+
+
+class TestAnalysisJobs(unittest.TestCase):
+    """Unit test class for background analysis jobs and the async endpoints."""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        main.Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        with session_factory() as db:
+            db.add(main.Tenant(id=31, name="t", guid="g31", region="us", gcp_project_id="p"))
+            db.commit()
+        self.release = threading.Event()
+        self.chronicle = mock.Mock()
+        self.chronicle.execute_dashboard_query.side_effect = self.fake_query
+        for patcher in (
+            mock.patch.object(main, "SessionLocal", session_factory),
+            mock.patch.object(main, "SECOPS_SDK_AVAILABLE", True),
+            mock.patch.object(main, "get_chronicle_client", return_value=self.chronicle),
+            mock.patch.object(main, "_analysis_cache", OrderedDict()),
+            mock.patch.object(main, "_tenant_contexts", {}),
+            mock.patch.object(main, "_analysis_jobs", OrderedDict()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fake_query(self, query, interval):
+        if "case_history" not in query:
+            self.release.wait(timeout=5)
+        return _payload({"n": [1, 2]})
+
+    def wait_for(self, job_id, status):
+        deadline = time.monotonic() + 5
+        while main.get_analysis_job(job_id)["status"] != status and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return main.get_analysis_job(job_id)
+
+    def test_job_reports_progress_and_result(self):
+        """Test case to verify a job reports fetched queries while running and the run summary when done.
+
+        Asserts:
+          The job is running with one of two queries fetched while the case query is
+          held back, then succeeds with a usable session, and its events end with the result.
+        """
+        request = main.AnalysisRequest(tenant_id=31, time_unit="DAY", start_time_val=1, time_sliced=False)
+        job = main.create_analysis_job(request)
+        self.assertEqual(job["status"], "queued")
+
+        deadline = time.monotonic() + 5
+        while main.get_analysis_job(job["job_id"])["queries_done"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        running = main.get_analysis_job(job["job_id"])
+        self.assertEqual((running["status"], running["queries_done"], running["queries_total"]), ("running", 1, 2))
+
+        self.release.set()
+        finished = self.wait_for(job["job_id"], "succeeded")
+        self.assertEqual(finished["cache"], "MISS")
+        self.assertEqual(finished["result"]["history_rows"], 2)
+        self.assertIsNotNone(main.get_analysis_session(finished["result"]["session_id"]))
+
+        async def read_events():
+            response = await main.stream_analysis_job(job["job_id"])
+            return [chunk async for chunk in response.body_iterator]
+        events = asyncio.run(read_events())
+        self.assertEqual(len(events), 1)
+        self.assertIn('"status": "succeeded"', events[0])
+
+    def test_failed_job_and_unknown_job(self):
+        """Test case to verify errors end the job as failed and unknown jobs are 404s."""
+        job = main.create_analysis_job(main.AnalysisRequest(tenant_id=99, time_unit="DAY", start_time_val=1))
+        failed = self.wait_for(job["job_id"], "failed")
+        self.assertEqual(failed["error"], "Tenant not found.")
+        with self.assertRaises(main.HTTPException) as raised:
+            main.read_analysis_job("missing")
+        self.assertEqual(raised.exception.status_code, 404)
+
+    def test_async_run_offloads_to_bounded_pool(self):
+        """Test case to verify /analysis/run executes on the SecOps pool rather than the event loop thread."""
+        self.release.set()
+        threads = []
+        original = main.run_analysis
+
+        def record_thread(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return original(*args, **kwargs)
+
+        request = main.AnalysisRequest(tenant_id=31, time_unit="DAY", start_time_val=1, time_sliced=False)
+        with main.SessionLocal() as db, mock.patch.object(main, "run_analysis", side_effect=record_thread):
+            response = Response()
+            summary = asyncio.run(main.run_analysis_endpoint(request, response, db))
+        self.assertEqual(summary["mttd_rows"], 2)
+        self.assertEqual(response.headers["X-MTTx-Cache"], "MISS")
+        self.assertTrue(threads[0].startswith("mttx-secops"))
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Unit test class for stage timing spans, run history and the metrics endpoint."""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        main.Base.metadata.create_all(bind=engine)
+        self.session_factory = sessionmaker(bind=engine)
+        patcher = mock.patch.object(main, "SessionLocal", self.session_factory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_scheduled_run_records_stage_durations(self):
+        """Test case to verify a scheduled run stores the duration of each timed stage.
+
+        Asserts:
+          The run history endpoint returns the run with the seconds spent in each span,
+          and spans nested in the same stage are summed.
+        """
+        def fake_run(tenant_id, schedule_id):
+            with main.timed_span("fetch"):
+                time.sleep(0.01)
+            main.observe_stage("calculate", 0.25)
+            main.observe_stage("calculate", 0.5)
+            return "success"
+
+        with mock.patch.object(main, "run_scheduled_analysis", side_effect=fake_run):
+            self.assertTrue(main.enqueue_scheduled_run(951, 77))
+            deadline = time.time() + 5
+            while not any(r["schedule_id"] == 77 for r in main.get_scheduler_status()["recent_runs"]) and time.time() < deadline:
+                time.sleep(0.01)
+
+        with self.session_factory() as db:
+            runs = [main.ScheduledRunResponse.model_validate(r) for r in main.get_schedule_runs(77, db=db)]
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0].status, "success")
+        self.assertEqual(runs[0].stage_seconds["calculate"], 0.75)
+        self.assertGreaterEqual(runs[0].stage_seconds["fetch"], 0.01)
+        self.assertGreaterEqual(runs[0].duration_seconds, runs[0].stage_seconds["fetch"])
+
+    def test_scheduled_run_retention(self):
+        """Test case to verify only the newest runs of each schedule are kept."""
+        run = {"tenant_id": 1, "status": "success", "enqueued_at": 0, "started_at": 1, "finished_at": 2, "queued_seconds": 1, "duration_seconds": 1}
+        with mock.patch.object(main, "SCHEDULED_RUN_RETENTION", 3):
+            for _ in range(5):
+                main.record_scheduled_run({**run, "schedule_id": 5}, {})
+            main.record_scheduled_run({**run, "schedule_id": 6}, {})
+
+        with self.session_factory() as db:
+            self.assertEqual(sorted(r.id for r in main.get_schedule_runs(5, db=db)), [3, 4, 5])
+            self.assertEqual(len(main.get_schedule_runs(6, db=db)), 1)
+
+    def test_failed_statement_does_not_leak_start_times(self):
+        """Test case to verify statements that raise leave no timing state on the connection."""
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        event.listen(engine, "before_cursor_execute", main._statement_started)
+        event.listen(engine, "after_cursor_execute", main._statement_finished)
+        with engine.connect() as conn:
+            for _ in range(3):
+                with self.assertRaises(Exception):
+                    conn.execute(text("SELECT * FROM missing_table"))
+            conn.execute(text("SELECT 1"))
+            self.assertNotIn("statement_started", conn.info)
+
+    @unittest.skipUnless(main.PROMETHEUS_AVAILABLE, "prometheus_client not installed")
+    def test_metrics_endpoint_exports_spans_and_counters(self):
+        """Test case to verify /metrics exports the stage histogram and the rows fetched counter."""
+        chronicle = mock.Mock()
+        chronicle.execute_dashboard_query.return_value = _payload({"n": [1, 2, 3]})
+        main.fetch_analysis_query(chronicle, "instrumented_query", "$x", "DAY", 7, time_sliced=False)
+
+        body = main.read_prometheus_metrics().body.decode()
+        self.assertIn('mttx_stage_duration_seconds_count{stage="secops_query"}', body)
+        self.assertIn('mttx_query_rows_fetched_total{query="instrumented_query"} 3.0', body)
+
+
+class TestScheduledRunQueue(unittest.TestCase):
+    """Unit test class for the scheduled run queue."""
+
+    def test_coalesces_and_limits_per_tenant(self):
+        """Test case to verify coalescing and the per-tenant concurrency limit.
+
+        Asserts:
+          A second run of a queued schedule is coalesced, a second schedule of the
+          same tenant waits in the queue, and finished runs record their duration.
+        """
+        release = threading.Event()
+        started = []
+
+        def fake_run(tenant_id, schedule_id):
+            started.append(schedule_id)
+            release.wait(5)
+            return "success"
+
+        with mock.patch.object(main, "run_scheduled_analysis", side_effect=fake_run), \
+                mock.patch.object(main, "SCHEDULER_TENANT_CONCURRENCY", 1):
+            self.assertTrue(main.enqueue_scheduled_run(901, 1))
+            self.assertFalse(main.enqueue_scheduled_run(901, 1))
+            self.assertTrue(main.enqueue_scheduled_run(901, 2))
+            self.assertTrue(main.enqueue_scheduled_run(902, 3))
+
+            deadline = time.time() + 5
+            while len(started) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            status = main.get_scheduler_status()
+            self.assertEqual(sorted(started), [1, 3])
+            self.assertEqual([q["schedule_id"] for q in status["queued"]], [2])
+
+            release.set()
+            while len(main.get_scheduler_status()["recent_runs"]) < 3 and time.time() < deadline:
+                time.sleep(0.01)
+
+        status = main.get_scheduler_status()
+        self.assertEqual(status["queue_depth"], 0)
+        self.assertEqual({r["schedule_id"] for r in status["recent_runs"][:3]}, {1, 2, 3})
+        self.assertTrue(all(r["status"] == "success" for r in status["recent_runs"][:3]))
+
+
+class TestChronicleClientCache(unittest.TestCase):
+    """Unit test class for the per-tenant Chronicle client cache."""
+
+    def test_reuses_client_until_invalidated_or_expired(self):
+        """Test case to verify clients are reused, invalidated and refreshed after the TTL."""
+        tenant = main.Tenant(id=77, name="t", guid="g", region="us", gcp_project_id="p")
+        client = mock.Mock()
+        client.chronicle.side_effect = lambda **kwargs: mock.Mock()
+        with mock.patch.object(main, "SecOpsClient", return_value=client, create=True) as secops_client, \
+                mock.patch.object(main, "_secops_client", None):
+            first = main.get_chronicle_client(tenant)
+            self.assertIs(main.get_chronicle_client(tenant), first)
+
+            main.invalidate_chronicle_client(77)
+            second = main.get_chronicle_client(tenant)
+            self.assertIsNot(second, first)
+
+            tenant.region = "europe"
+            self.assertIsNot(main.get_chronicle_client(tenant), second)
+
+            with mock.patch.object(main, "SECOPS_CLIENT_TTL_SECONDS", 0):
+                main.get_chronicle_client(tenant)
+            self.assertEqual(client.chronicle.call_count, 4)
+            self.assertEqual(secops_client.call_count, 2)
+        main.invalidate_chronicle_client(77)
+
+
+if __name__ == "__main__":
+    unittest.main()
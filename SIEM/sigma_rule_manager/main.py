@@ -3,12 +3,15 @@
 
 # Import necessary libraries
 import uvicorn
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Iterator, Dict, Any
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, or_, func, Table
+from pydantic import BaseModel, field_validator
+from typing import List, Optional, Iterator, Dict, Any, Tuple, Callable
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, or_, func, Table, inspect, text, UniqueConstraint
 from sqlalchemy.orm import sessionmaker, Session, relationship, declarative_base
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import table, column
 import datetime
 from datetime import timedelta, timezone
 import os
@@ -17,6 +20,15 @@ import yaml
 from pathlib import Path
 import logging
 import json
+import hashlib
+import multiprocessing
+import random
+import socket
+import time
+from importlib.metadata import version, PackageNotFoundError
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice, repeat
 
 # --- Updated imports for Correct Conversion Logic ---
 # Alias the imported SigmaRule to avoid naming conflict with our SQLAlchemy model
@@ -31,7 +43,20 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # --- 1. Database Configuration ---
 DATABASE_URL = "sqlite:///./sigma_manager.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# The API, its embedded worker and worker.py write the same file. WAL lets readers run alongside a
+# writer, and the busy timeout makes a writer wait for a committing batch instead of failing with
+# "database is locked".
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SIGMA_SQLITE_BUSY_TIMEOUT_MS", "30000"))
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.close()
+
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+event.listen(engine, "connect", _configure_sqlite_connection)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -53,6 +78,8 @@ class SigmaLibrary(Base):
     name = Column(String, unique=True, index=True)
     source_path = Column(String)
     last_synced_at = Column(DateTime, nullable=True)
+    last_synced_commit = Column(String, nullable=True) # HEAD SHA of the last sync, diffed against on the next one
+    failed_paths = Column(Text, nullable=True) # JSON list of files the last sync could not read, re-read by the next one
     rules = relationship("SigmaRule", back_populates="library")
 
 # Association table for the many-to-many relationship between rules and tags
@@ -122,9 +149,106 @@ class Deployment(Base):
     yaral_rule = relationship("YaraLRule", back_populates="deployments")
     tenant = relationship("Tenant", back_populates="deployments")
 
+class ConversionCache(Base):
+    """Successful conversions by Sigma content hash, so unchanged rules are not converted again by the same converter."""
+    __tablename__ = "conversion_cache"
+    cache_id = Column(Integer, primary_key=True)
+    content_hash = Column(String, nullable=False) # SHA-256 of the rule's raw_content
+    converter = Column(String, nullable=False) # e.g. "pySigma 0.11.0/secops 0.1.0"
+    converted_content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    __table_args__ = (UniqueConstraint("content_hash", "converter", name="uq_conversion_cache_hash_converter"),)
+
+class Job(Base):
+    """A queued background task, claimed and run by a worker (worker.py). Its progress is polled by the UI."""
+    __tablename__ = "jobs"
+    job_id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String, index=True) # sync, conversion, ai_conversion or deployment
+    status = Column(String, default="queued") # queued, running, succeeded, failed
+    payload = Column(Text, nullable=True) # JSON encoded handler arguments, e.g. {"library_id": 1}
+    worker_id = Column(String, nullable=True) # host:pid of the worker that claimed the job
+    heartbeat_at = Column(DateTime, nullable=True) # Refreshed by the worker while the job runs
+    attempts = Column(Integer, default=0)
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    result = Column(Text, nullable=True) # JSON encoded counts, e.g. {"success": 10, "cached": 2, "failed": 1}
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
 
 # --- Create the database tables ---
+# create_all does not alter existing tables, so columns added to models later are listed here.
+ADDED_COLUMNS = [
+    ("sigma_libraries", "last_synced_commit", "VARCHAR"),
+    ("sigma_libraries", "failed_paths", "TEXT"),
+]
+
+def add_missing_columns(bind):
+    existing_tables = set(inspect(bind).get_table_names())
+    with bind.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            if table in existing_tables and column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+                logging.info(f"Adding column {table}.{column}")
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
+
+# --- Full-Text Search Index ---
+# An FTS5 table over the searchable rule fields, keyed by rule_id (its rowid). The sync task keeps it
+# up to date and /api/sigma-rules/search ranks prefix matches from it. SQLite builds without FTS5 fall
+# back to LIKE filtering. The search filter of /api/sigma-rules keeps matching substrings with LIKE.
+SEARCH_INDEX_COLUMNS = ("title", "description", "author", "file_path", "tags", "logsource")
+# bm25 weights per column, in SEARCH_INDEX_COLUMNS order: title matches rank highest.
+SEARCH_RANK_WEIGHTS = (10.0, 2.0, 3.0, 1.0, 5.0, 2.0)
+sigma_rules_fts = table("sigma_rules_fts", column("rowid")) # Lightweight construct for queries; not part of Base.metadata
+SEARCH_INDEX_SELECT = """
+    SELECT r.rule_id, r.title, r.description, r.author, r.file_path,
+        (SELECT group_concat(t.name, ' ') FROM rule_tag_association a JOIN tags t ON t.tag_id = a.tag_id WHERE a.rule_id = r.rule_id),
+        trim(coalesce(r.logsource_product, '') || ' ' || coalesce(r.logsource_category, '') || ' ' || coalesce(r.logsource_service, ''))
+    FROM sigma_rules r
+"""
+
+def create_search_index(bind) -> bool:
+    """Creates the FTS5 table, filling it when rules exist but the index is empty (e.g. on upgrade). Returns False without FTS5."""
+    try:
+        with bind.begin() as conn:
+            conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS sigma_rules_fts USING fts5({', '.join(SEARCH_INDEX_COLUMNS)})"))
+            if not conn.execute(text("SELECT 1 FROM sigma_rules_fts LIMIT 1")).first() and conn.execute(text("SELECT 1 FROM sigma_rules LIMIT 1")).first():
+                logging.info("Building the rule search index...")
+                conn.execute(text(f"INSERT INTO sigma_rules_fts(rowid, {', '.join(SEARCH_INDEX_COLUMNS)}) {SEARCH_INDEX_SELECT}"))
+        return True
+    except OperationalError as e:
+        logging.warning(f"SQLite FTS5 is not available ({e}). Rule search falls back to LIKE filtering.")
+        return False
+
+SEARCH_INDEX_AVAILABLE = create_search_index(engine)
+
+def index_rules_for_search(db: Session, rule_ids: List[int]):
+    """Replaces the search index rows of the given rules; rules that no longer exist are only removed."""
+    if not SEARCH_INDEX_AVAILABLE:
+        return
+    for start in range(0, len(rule_ids), 500):
+        chunk = ", ".join(str(int(rule_id)) for rule_id in rule_ids[start:start + 500])
+        db.execute(text(f"DELETE FROM sigma_rules_fts WHERE rowid IN ({chunk})"))
+        db.execute(text(f"INSERT INTO sigma_rules_fts(rowid, {', '.join(SEARCH_INDEX_COLUMNS)}) {SEARCH_INDEX_SELECT} WHERE r.rule_id IN ({chunk})"))
+
+def build_search_query(search: str) -> Optional[str]:
+    """Turns user input into an FTS5 query: every word must match the start of a word in some field."""
+    terms = [term.replace('"', '""') for term in search.split()]
+    return " ".join(f'"{term}"*' for term in terms) or None
+
+def filter_rules_by_search(query, search: str):
+    """Restricts a SigmaRule query to rules containing the search text in their title, description, author or file path."""
+    search_term = f"%{search.lower()}%"
+    return query.filter(or_(
+        func.lower(SigmaRule.title).like(search_term),
+        func.lower(SigmaRule.description).like(search_term),
+        func.lower(SigmaRule.author).like(search_term),
+        func.lower(SigmaRule.file_path).like(search_term)
+    ))
 
 # --- 3. Pydantic Schemas (Unchanged) ---
 
@@ -145,6 +269,7 @@ class SigmaLibraryCreate(BaseModel):
 class SigmaLibraryResponse(SigmaLibraryCreate):
     library_id: int
     last_synced_at: Optional[datetime.datetime] = None
+    last_synced_commit: Optional[str] = None
     class Config:
         from_attributes = True
 
@@ -219,6 +344,29 @@ class ValidationResponse(BaseModel):
 class YaraLRuleUpdate(BaseModel):
     converted_content: str
 
+class JobResponse(BaseModel):
+    job_id: int
+    job_type: str
+    status: str
+    payload: Optional[Dict[str, Any]] = None
+    worker_id: Optional[str] = None
+    attempts: int = 0
+    total: int
+    processed: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime.datetime
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+
+    @field_validator('result', 'payload', mode='before')
+    @classmethod
+    def parse_json(cls, v: Any) -> Any:
+        return json.loads(v) if isinstance(v, str) else v
+
+    class Config:
+        from_attributes = True
+
 
 # --- 4. FastAPI Application Setup (Unchanged) ---
 app = FastAPI(
@@ -244,17 +392,173 @@ def get_db():
         db.close()
 
 # --- 6. Background Tasks ---
-def sync_sigma_rules(library_id: int):
+
+# --- Rule File Parsing ---
+# YAML parsing dominates a full sync, so rule files are parsed in chunks on a process pool and only
+# the extracted records come back to the syncing thread. Small (incremental) syncs parse inline.
+SYNC_PARSE_PROCESSES = int(os.getenv("SIGMA_SYNC_PARSE_PROCESSES", str(os.cpu_count() or 1)))
+SYNC_PARSE_CHUNK_SIZE = 100 # Files per process pool task
+SYNC_BATCH_SIZE = 500 # Parsed files upserted per database round trip
+# libyaml's C loader is several times faster than the pure Python one.
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+_parse_executor: Optional[ProcessPoolExecutor] = None
+_parse_executor_lock = threading.Lock()
+
+def parse_rule_file(raw_content: str) -> Optional[Dict[str, Any]]:
+    """
+    Extracts the SigmaRule columns and tag names from a rule file.
+    Returns None for YAML files that are not Sigma rules.
+    """
+    documents = list(yaml.load_all(raw_content, Loader=YAML_LOADER))
+    if not documents:
+        return None
+    rule_yaml = documents[0]
+    if not isinstance(rule_yaml, dict) or 'title' not in rule_yaml or 'id' not in rule_yaml:
+        return None
+
+    logsource = rule_yaml.get('logsource', {}) or {}
+    return {
+        'raw_content': raw_content,
+        'title': rule_yaml.get('title'),
+        'sigma_id': rule_yaml.get('id'),
+        'status': rule_yaml.get('status'),
+        'description': rule_yaml.get('description'),
+        'author': rule_yaml.get('author'),
+        'date': str(rule_yaml.get('date')),
+        'modified': str(rule_yaml.get('modified')),
+        'level': rule_yaml.get('level'),
+        'logsource_product': logsource.get('product'),
+        'logsource_category': logsource.get('category'),
+        'logsource_service': logsource.get('service'),
+        'tags': [tag_name.strip() for tag_name in rule_yaml.get('tags', []) or []],
+    }
+
+def parse_rule_files(repo_path: str, relative_paths: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Reads and parses a chunk of rule files. Runs in the parse process pool.
+    Returns (relative_path, record or None, error message or None) per file.
+    """
+    results = []
+    for relative_path in relative_paths:
+        try:
+            with open(Path(repo_path) / relative_path, 'r', encoding='utf-8') as f:
+                results.append((relative_path, parse_rule_file(f.read()), None))
+        except Exception as e:
+            results.append((relative_path, None, str(e)))
+    return results
+
+def iter_parsed_rule_files(repo_path: Path, relative_paths: List[str]) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """Yields parse_rule_files results for every path, in order, parsing on the process pool when there is more than one chunk."""
+    global _parse_executor
+    chunks = [relative_paths[i:i + SYNC_PARSE_CHUNK_SIZE] for i in range(0, len(relative_paths), SYNC_PARSE_CHUNK_SIZE)]
+    if SYNC_PARSE_PROCESSES <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from parse_rule_files(str(repo_path), chunk)
+        return
+    with _parse_executor_lock:
+        if _parse_executor is None:
+            _parse_executor = ProcessPoolExecutor(max_workers=SYNC_PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    for results in _parse_executor.map(parse_rule_files, repeat(str(repo_path)), chunks):
+        yield from results
+
+def get_changed_rule_files(repo: git.Repo, since_commit: Optional[str]) -> Optional[Tuple[List[str], List[str], Dict[str, str]]]:
+    """
+    Diffs since_commit against HEAD and returns (changed, deleted, renamed) .yml paths relative to the repo.
+    changed holds added, modified and renamed-to paths; renamed maps old paths to new ones.
+    Returns None when a full sync is needed: the library was never synced or its last commit is gone (e.g. after a force push).
+    """
+    if not since_commit:
+        return None
+    try:
+        old_commit = repo.commit(since_commit)
+    except (ValueError, git.BadName, git.BadObject):
+        logging.warning(f"Last synced commit {since_commit} is not in the repository. Running a full sync.")
+        return None
+
+    changed, deleted, renamed = [], [], {}
+    for diff in old_commit.diff(repo.head.commit):
+        old_path = str(Path(diff.a_path)) if diff.a_path and diff.a_path.endswith(".yml") else None
+        new_path = str(Path(diff.b_path)) if diff.b_path and diff.b_path.endswith(".yml") else None
+        if diff.change_type == "D":
+            new_path = None
+        elif diff.change_type == "A":
+            old_path = None
+        if diff.change_type == "R" and old_path and new_path:
+            renamed[old_path] = new_path
+        elif old_path and not new_path:
+            deleted.append(old_path)
+        if new_path:
+            changed.append(new_path)
+    return changed, deleted, renamed
+
+def delete_sigma_rules(db: Session, rules: List[SigmaRule]) -> int:
+    """
+    Deletes rules whose files were removed, with their tag associations and YARA-L conversions.
+    Rules whose conversion is deployed are kept so the deployment history stays intact.
+    """
+    deleted_ids = []
+    for rule in rules:
+        if rule.yaral_rule and rule.yaral_rule.deployments:
+            logging.warning(f"Keeping removed rule {rule.file_path}: its YARA-L conversion is deployed.")
+            continue
+        if rule.yaral_rule:
+            db.delete(rule.yaral_rule)
+        db.delete(rule)
+        deleted_ids.append(rule.rule_id)
+    db.flush()
+    index_rules_for_search(db, deleted_ids)
+    return len(deleted_ids)
+
+def upsert_rule_batch(db: Session, library_id: int, rows: List[Dict[str, Any]], rule_tags: Dict[str, List[str]], tag_ids: Dict[str, int]) -> List[str]:
+    """
+    Writes a batch of new and changed rules and replaces their tag associations with a few bulk statements.
+    rule_tags maps each row's file_path to its tag names; tag_ids (name -> tag_id) is extended with the tags created here.
+    Returns the paths that were skipped because another library already has a rule at that file_path.
+    """
+    new_tags = {name for tags in rule_tags.values() for name in tags} - tag_ids.keys()
+    if new_tags:
+        db.execute(sqlite_insert(Tag.__table__).on_conflict_do_nothing(index_elements=["name"]), [{"name": name} for name in new_tags])
+        tag_ids.update(db.query(Tag.name, Tag.tag_id).filter(Tag.name.in_(new_tags)))
+
+    stmt = sqlite_insert(SigmaRule.__table__)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["file_path"],
+        set_={column: stmt.excluded[column] for column in rows[0] if column not in ("file_path", "library_id")},
+        # file_path is unique across libraries; never overwrite another library's rule.
+        where=SigmaRule.library_id == stmt.excluded.library_id
+    ), rows)
+
+    rule_ids = dict(db.query(SigmaRule.file_path, SigmaRule.rule_id).filter(
+        SigmaRule.library_id == library_id, SigmaRule.file_path.in_(list(rule_tags))
+    ))
+    skipped = [path for path in rule_tags if path not in rule_ids]
+    if skipped:
+        logging.warning(f"Skipped {len(skipped)} rules whose file path belongs to another library: {', '.join(skipped[:10])}")
+    db.execute(rule_tag_association.delete().where(rule_tag_association.c.rule_id.in_(list(rule_ids.values()))))
+    associations = [
+        {"rule_id": rule_ids[path], "tag_id": tag_ids[name]}
+        for path, tags in rule_tags.items() if path in rule_ids
+        for name in dict.fromkeys(tags)
+    ]
+    if associations:
+        db.execute(rule_tag_association.insert(), associations)
+    index_rules_for_search(db, list(rule_ids.values()))
+    return skipped
+
+def sync_sigma_rules(library_id: int, job_id: Optional[int] = None):
     """
     Clones or pulls a git repo and upserts Sigma rules into the database.
+    After the first sync only the .yml files changed since the last synced commit are read, plus
+    the files the previous sync failed to read. Rules whose content did not change keep their conversion status.
+    Each batch is committed with the job's progress; the commit is only recorded once every file is stored.
     """
     db = SessionLocal()
-    processed_tags = {}  # Local cache for tags within this transaction
     try:
         db_library = db.query(SigmaLibrary).filter(SigmaLibrary.library_id == library_id).first()
         if not db_library:
-            logging.error(f"Error: Library {library_id} not found in background task.")
-            return
+            # Raised so the job is recorded as failed rather than succeeded.
+            raise ValueError(f"Library {library_id} not found.")
 
         repo_path_str = f"./sigma_repos/{db_library.name.replace(' ', '_')}"
         repo_path = Path(repo_path_str)
@@ -266,147 +570,301 @@ def sync_sigma_rules(library_id: int):
         else:
             logging.info(f"Cloning {db_library.name} from {db_library.source_path}...")
             repo_path.mkdir(parents=True, exist_ok=True)
-            git.Repo.clone_from(db_library.source_path, repo_path)
-
-        rule_count = 0
-        for yaml_file in repo_path.rglob("*.yml"):
-            relative_path = str(yaml_file.relative_to(repo_path))
-            
-            try:
-                with open(yaml_file, 'r', encoding='utf-8') as f:
-                    raw_content = f.read()
-                    documents = list(yaml.safe_load_all(raw_content))
-                    if not documents:
-                        continue
-                    rule_yaml = documents[0]
-
-                if 'title' in rule_yaml and 'id' in rule_yaml and isinstance(rule_yaml, dict):
-                    existing_rule = db.query(SigmaRule).filter(
-                        SigmaRule.library_id == library_id,
-                        SigmaRule.file_path == relative_path
-                    ).first()
-
-                    logsource = rule_yaml.get('logsource', {}) or {}
-                    
-                    rule_data = {
-                        'raw_content': raw_content,
-                        'title': rule_yaml.get('title'),
-                        'sigma_id': rule_yaml.get('id'),
-                        'status': rule_yaml.get('status'),
-                        'description': rule_yaml.get('description'),
-                        'author': rule_yaml.get('author'),
-                        'date': str(rule_yaml.get('date')),
-                        'modified': str(rule_yaml.get('modified')),
-                        'level': rule_yaml.get('level'),
-                        'logsource_product': logsource.get('product'),
-                        'logsource_category': logsource.get('category'),
-                        'logsource_service': logsource.get('service'),
-                        'conversion_status': "pending"
-                    }
+            repo = git.Repo.clone_from(db_library.source_path, repo_path)
+
+        head_commit = repo.head.commit.hexsha
+        retry_paths = json.loads(db_library.failed_paths or "[]")
+        counts = {"added": 0, "updated": 0, "unchanged": 0, "deleted": 0, "failed": 0, "skipped": 0}
+        if head_commit == db_library.last_synced_commit and not retry_paths:
+            db_library.last_synced_at = datetime.datetime.utcnow()
+            update_job(db, job_id, result=counts)
+            db.commit()
+            logging.info(f"Library '{db_library.name}' is already synced at {head_commit[:12]}.")
+            return
+
+        diff = get_changed_rule_files(repo, db_library.last_synced_commit)
+        if diff is None:
+            changed = [str(yaml_file.relative_to(repo_path)) for yaml_file in repo_path.rglob("*.yml")]
+            on_disk = set(changed)
+            deleted = [path for (path,) in db.query(SigmaRule.file_path).filter(SigmaRule.library_id == library_id) if path not in on_disk]
+            renamed = {}
+            logging.info(f"Full sync of '{db_library.name}': {len(changed)} files.")
+        else:
+            changed, deleted, renamed = diff
+            # Files that failed last time are read again, unless they have since been removed or renamed.
+            known_paths = set(changed) | set(deleted) | renamed.keys()
+            changed += [path for path in retry_paths if path not in known_paths and (repo_path / path).is_file()]
+            logging.info(f"Incremental sync of '{db_library.name}' from {db_library.last_synced_commit[:12]} to {head_commit[:12]}: "
+                         f"{len(changed)} changed, {len(deleted)} deleted, {len(renamed)} renamed files.")
+
+        update_job(db, job_id, total=len(changed))
+
+        # Move renamed rules to their new path first, so they are updated in place and keep their conversions.
+        for old_path, new_path in renamed.items():
+            db.query(SigmaRule).filter(SigmaRule.library_id == library_id, SigmaRule.file_path == old_path).update({SigmaRule.file_path: new_path})
+        if renamed:
+            index_rules_for_search(db, [rule_id for (rule_id,) in db.query(SigmaRule.rule_id).filter(
+                SigmaRule.library_id == library_id, SigmaRule.file_path.in_(list(renamed.values()))
+            )])
+
+        # Existing rules and tags are loaded once, so the batches below need no per-file lookups.
+        existing_rules = {
+            file_path: raw_content for file_path, raw_content in
+            db.query(SigmaRule.file_path, SigmaRule.raw_content).filter(SigmaRule.library_id == library_id)
+        }
+        tag_ids = dict(db.query(Tag.name, Tag.tag_id))
+
+        failed_paths = []
+        processed = 0
+        parsed_files = iter_parsed_rule_files(repo_path, changed)
+        while batch := list(islice(parsed_files, SYNC_BATCH_SIZE)):
+            rows, rule_tags = [], {}
+            for relative_path, rule_data, error in batch:
+                if error:
+                    logging.error(f"Error processing file {relative_path}: {error}")
+                    failed_paths.append(relative_path)
+                    counts["failed"] += 1
+                    continue
+                if rule_data is None:
+                    # The file is no longer a Sigma rule.
+                    if relative_path in existing_rules:
+                        deleted.append(relative_path)
+                    continue
+                if existing_rules.get(relative_path) == rule_data['raw_content']:
+                    counts["unchanged"] += 1
+                    continue
+
+                rule_tags[relative_path] = rule_data.pop('tags')
+                # New or edited content invalidates an earlier conversion.
+                rows.append({**rule_data, 'file_path': relative_path, 'library_id': library_id, 'conversion_status': "pending", 'conversion_error': None})
+            if rows:
+                skipped = set(upsert_rule_batch(db, library_id, rows, rule_tags, tag_ids))
+                counts["skipped"] += len(skipped)
+                for path in rule_tags.keys() - skipped:
+                    counts["updated" if path in existing_rules else "added"] += 1
+            processed += len(batch)
+            update_job(db, job_id, processed=processed, result=counts)
+            db.commit()
+
+        if deleted:
+            removed_rules = db.query(SigmaRule).filter(SigmaRule.library_id == library_id, SigmaRule.file_path.in_(deleted)).all()
+            counts["deleted"] += delete_sigma_rules(db, removed_rules)
 
-                    tag_objects = []
-                    tag_list = rule_yaml.get('tags', [])
-                    if tag_list:
-                        for tag_name in tag_list:
-                            tag_name = tag_name.strip()
-                            if tag_name in processed_tags:
-                                db_tag = processed_tags[tag_name]
-                            else:
-                                db_tag = db.query(Tag).filter(Tag.name == tag_name).first()
-                                if not db_tag:
-                                    db_tag = Tag(name=tag_name)
-                                    db.add(db_tag)
-                                processed_tags[tag_name] = db_tag
-                            tag_objects.append(db_tag)
-
-                    if existing_rule:
-                        for key, value in rule_data.items():
-                            setattr(existing_rule, key, value)
-                        existing_rule.tags = tag_objects
-                    else:
-                        new_rule = SigmaRule(
-                            **rule_data,
-                            file_path=relative_path,
-                            library_id=library_id
-                        )
-                        new_rule.tags = tag_objects
-                        db.add(new_rule)
-                    
-                    rule_count += 1
-            except Exception as e:
-                logging.error(f"Error processing file {relative_path}: {e}")
-        
         db_library.last_synced_at = datetime.datetime.utcnow()
+        db_library.last_synced_commit = head_commit
+        db_library.failed_paths = json.dumps(failed_paths) if failed_paths else None
+        update_job(db, job_id, result=counts)
         db.commit()
-        logging.info(f"Sync complete for library '{db_library.name}'. Processed {rule_count} rules.")
+        logging.info(f"Sync complete for library '{db_library.name}' at {head_commit[:12]}: {counts}.")
 
     finally:
         db.close()
 
-# --- REVISED: Background Task for Rule Conversion (with fix) ---
-def convert_rules_task(sigma_rule_ids: List[int]):
+# --- Rule Conversion Engine ---
+# pySigma conversion is CPU-bound, so rules are converted on a process pool with one backend and
+# pipeline per worker. Results are committed in batches and successful outputs are cached by the
+# hash of the rule content and the pySigma/backend versions, so unchanged rules are never reconverted.
+CONVERSION_PROCESSES = int(os.getenv("SIGMA_CONVERSION_PROCESSES", str(os.cpu_count() or 1)))
+CONVERSION_BATCH_SIZE = 200 # Rules converted and committed per batch
+CONVERSION_INLINE_MAX = 10 # Smaller conversions run in the calling thread without the pool
+
+_conversion_executor: Optional[ProcessPoolExecutor] = None
+_conversion_executor_lock = threading.Lock()
+_worker_backend = None # The SecOpsBackend of a conversion worker process
+
+def content_hash(raw_content: str) -> str:
+    return hashlib.sha256(raw_content.encode("utf-8")).hexdigest()
+
+def get_converter_version() -> str:
+    """Identifies the pySigma and SecOps backend/pipeline versions; cached conversions are only reused for the same one."""
+    versions = []
+    for label, package in (("pySigma", "pysigma"), ("secops", "pysigma-backend-secops")):
+        try:
+            versions.append(f"{label} {version(package)}")
+        except PackageNotFoundError:
+            versions.append(f"{label} unknown")
+    return "/".join(versions)
+
+def create_conversion_backend():
+    # Initialize the backend WITH the UDM pipeline
+    return SecOpsBackend(processing_pipeline=secops_udm_pipeline())
+
+def _init_conversion_worker():
+    global _worker_backend
+    _worker_backend = create_conversion_backend()
+
+def convert_rule_content(raw_content: str, backend=None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Converts one Sigma rule to YARA-L with the given backend, or the worker's own.
+    Returns (yaral_content, None) on success and (None, error message) on failure.
+    """
+    try:
+        # Load the individual rule from its raw YAML content using the aliased parser
+        rule = SigmaRuleParser.from_yaml(raw_content)
+        converted_rules = (backend or _worker_backend).convert_rule(rule, "yara_l")
+        if not converted_rules:
+            raise ValueError("Conversion resulted in no output. The rule might be unsupported.")
+        # FIX: Replace 'conditions:' with 'condition:' to address 3rd party library bug
+        return converted_rules[0].replace("conditions:", "condition:"), None
+    except Exception as e:
+        return None, str(e)
+
+def convert_rule_contents(raw_contents: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """Converts rule contents in order, on the process pool unless there are only a few."""
+    global _conversion_executor
+    if CONVERSION_PROCESSES <= 1 or len(raw_contents) <= CONVERSION_INLINE_MAX:
+        backend = create_conversion_backend()
+        return [convert_rule_content(raw_content, backend) for raw_content in raw_contents]
+    with _conversion_executor_lock:
+        if _conversion_executor is None:
+            _conversion_executor = ProcessPoolExecutor(
+                max_workers=CONVERSION_PROCESSES, mp_context=multiprocessing.get_context("spawn"), initializer=_init_conversion_worker
+            )
+    chunksize = max(1, len(raw_contents) // (CONVERSION_PROCESSES * 4))
+    return list(_conversion_executor.map(convert_rule_content, raw_contents, chunksize=chunksize))
+
+def save_conversion(db: Session, db_rule: SigmaRule, existing_yaral: Optional[YaraLRule], yaral_content: str, source: str):
+    """Stores a successful conversion on the rule's YARA-L rule and marks the rule converted."""
+    if existing_yaral:
+        existing_yaral.converted_content = yaral_content
+        existing_yaral.source = source
+    else:
+        db.add(YaraLRule(sigma_rule_id=db_rule.rule_id, converted_content=yaral_content, source=source))
+    db_rule.conversion_status = "success"
+    db_rule.conversion_error = None
+
+def convert_rules_task(sigma_rule_ids: List[int], job_id: Optional[int] = None):
     """
     Takes a list of SigmaRule IDs and attempts to convert them to YARA-L.
-    Updates the database with the result.
+    Updates the database with the result, one commit per batch of rules.
     """
     db = SessionLocal()
-    # Initialize the backend WITH the UDM pipeline
-    udm_pipeline = secops_udm_pipeline()
-    backend = SecOpsBackend(processing_pipeline=udm_pipeline)
-
+    converter = get_converter_version()
+    counts = {"cached": 0, "success": 0, "failed": 0}
     try:
-        for rule_id in sigma_rule_ids:
-            db_rule = db.query(SigmaRule).filter(SigmaRule.rule_id == rule_id).first()
-            if not db_rule:
-                continue
-
-            try:
-                # Load the individual rule from its raw YAML content using the aliased parser
-                rule = SigmaRuleParser.from_yaml(db_rule.raw_content)
-                
-                # Convert the single rule
-                converted_rules = backend.convert_rule(rule, "yara_l")
-                
-                if not converted_rules:
-                    raise ValueError("Conversion resulted in no output. The rule might be unsupported.")
-
-                yaral_content = converted_rules[0]
-                # FIX: Replace 'conditions:' with 'condition:' to address 3rd party library bug
-                yaral_content = yaral_content.replace("conditions:", "condition:")
-
-                existing_yaral = db.query(YaraLRule).filter(YaraLRule.sigma_rule_id == rule_id).first()
-                if existing_yaral:
-                    existing_yaral.converted_content = yaral_content
-                    existing_yaral.source = 'pySigma'
+        for start in range(0, len(sigma_rule_ids), CONVERSION_BATCH_SIZE):
+            batch_ids = sigma_rule_ids[start:start + CONVERSION_BATCH_SIZE]
+            db_rules = db.query(SigmaRule).filter(SigmaRule.rule_id.in_(batch_ids)).all()
+            existing_yarals = {y.sigma_rule_id: y for y in db.query(YaraLRule).filter(YaraLRule.sigma_rule_id.in_(batch_ids))}
+            hashes = {db_rule.rule_id: content_hash(db_rule.raw_content) for db_rule in db_rules}
+            cached = dict(db.query(ConversionCache.content_hash, ConversionCache.converted_content).filter(
+                ConversionCache.converter == converter, ConversionCache.content_hash.in_(set(hashes.values()))
+            ))
+
+            # Convert each distinct uncached content once.
+            to_convert = {}
+            for db_rule in db_rules:
+                if hashes[db_rule.rule_id] not in cached:
+                    to_convert.setdefault(hashes[db_rule.rule_id], db_rule.raw_content)
+            results = dict(zip(to_convert, convert_rule_contents(list(to_convert.values()))))
+            cache_rows = [
+                {"content_hash": rule_hash, "converter": converter, "converted_content": yaral_content}
+                for rule_hash, (yaral_content, _) in results.items() if yaral_content is not None
+            ]
+            if cache_rows:
+                # A concurrent task may have cached the same content already.
+                db.execute(sqlite_insert(ConversionCache.__table__).on_conflict_do_nothing(), cache_rows)
+
+            for db_rule in db_rules:
+                rule_hash = hashes[db_rule.rule_id]
+                if rule_hash in cached:
+                    save_conversion(db, db_rule, existing_yarals.get(db_rule.rule_id), cached[rule_hash], 'pySigma')
+                    counts["cached"] += 1
+                    continue
+                yaral_content, error = results[rule_hash]
+                if yaral_content is None:
+                    db_rule.conversion_status = "failed"
+                    db_rule.conversion_error = error
+                    # Add logging for the conversion error
+                    logging.error(f"Failed to convert rule ID {db_rule.rule_id} ({db_rule.title}): {error}")
+                    counts["failed"] += 1
                 else:
-                    new_yaral_rule = YaraLRule(
-                        sigma_rule_id=rule_id,
-                        converted_content=yaral_content,
-                        source='pySigma'
-                    )
-                    db.add(new_yaral_rule)
-                
-                db_rule.conversion_status = "success"
-                db_rule.conversion_error = None
-
-            except Exception as e:
-                db_rule.conversion_status = "failed"
-                db_rule.conversion_error = str(e)
-                # Add logging for the conversion error
-                logging.error(f"Failed to convert rule ID {rule_id} ({db_rule.title}): {e}")
-            
+                    save_conversion(db, db_rule, existing_yarals.get(db_rule.rule_id), yaral_content, 'pySigma')
+                    counts["success"] += 1
+
+            update_job(db, job_id, processed=min(start + CONVERSION_BATCH_SIZE, len(sigma_rule_ids)), result=counts)
             db.commit()
-        logging.info(f"Conversion task finished. Processed {len(sigma_rule_ids)} rules.")
+            logging.info(f"Converted {min(start + CONVERSION_BATCH_SIZE, len(sigma_rule_ids))} of {len(sigma_rule_ids)} rules.")
+        logging.info(f"Conversion task finished. Processed {len(sigma_rule_ids)} rules: {counts}.")
     finally:
         db.close()
 
-def convert_rules_with_ai_task(sigma_rule_ids: List[int]):
+# --- AI Rule Conversion ---
+# Gemini requests are sent from a thread pool, paced by a process-wide token bucket and retried with
+# jittered exponential backoff when the API answers 429. Outputs are cached by content hash like
+# pySigma conversions, so identical Sigma content is only sent once.
+AI_CONVERSION_CONCURRENCY = int(os.getenv("SIGMA_AI_CONVERSION_CONCURRENCY", "4"))
+AI_REQUESTS_PER_MINUTE = float(os.getenv("SIGMA_AI_REQUESTS_PER_MINUTE", "30"))
+AI_MAX_RETRIES = int(os.getenv("SIGMA_AI_MAX_RETRIES", "5"))
+AI_RETRY_BASE_SECONDS = 2.0
+AI_CONVERSION_BATCH_SIZE = 20 # Rules committed, and reported to the job, per batch
+AI_CONVERTER = "SecOps Gemini"
+
+class TokenBucket:
+    """Thread-safe token bucket. acquire() blocks until a request may be sent."""
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+gemini_rate_limiter = TokenBucket(AI_REQUESTS_PER_MINUTE / 60, capacity=AI_CONVERSION_CONCURRENCY)
+
+def is_rate_limit_error(e: Exception) -> bool:
+    response = getattr(e, "response", None) or getattr(e.__cause__, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    message = str(e)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "Too Many Requests" in message
+
+def convert_rule_with_gemini(chronicle, raw_content: str) -> str:
+    """Asks Gemini to convert one Sigma rule and returns the YARA-L from the first code block of the answer."""
+    prompt = f"Convert this Sigma rule into YARA-L: {raw_content}"
+    for attempt in range(AI_MAX_RETRIES + 1):
+        gemini_rate_limiter.acquire()
+        try:
+            response = chronicle.gemini(prompt)
+            break
+        except Exception as e:
+            if attempt == AI_MAX_RETRIES or not is_rate_limit_error(e):
+                raise
+            # Full jitter keeps concurrent workers from retrying in lockstep.
+            delay = random.uniform(0, AI_RETRY_BASE_SECONDS * 2 ** attempt)
+            logging.warning(f"Gemini rate limit hit, retrying in {delay:.1f}s (attempt {attempt + 1}/{AI_MAX_RETRIES}).")
+            time.sleep(delay)
+
+    # I'll assume the YARA-L rule is in the first code block
+    code_blocks = response.get_code_blocks()
+    if not code_blocks:
+        logging.error(f"AI conversion resulted in no code block. Full response: {response}")
+        raise ValueError("AI conversion resulted in no code block.")
+    # FIX: Replace 'conditions:' with 'condition:' to address 3rd party library bug
+    return code_blocks[0].content.replace("conditions:", "condition:")
+
+def convert_rules_with_ai_task(sigma_rule_ids: List[int], job_id: Optional[int] = None):
     """
     Takes a list of SigmaRule IDs and attempts to convert them to YARA-L using AI.
-    Updates the database with the result.
+    Updates the database with the result, and the job's progress, after every batch.
     """
     db = SessionLocal()
     try:
+        update_job(db, job_id, total=len(sigma_rule_ids))
+        db.commit()
+
         # For now, let's assume a default tenant for the Gemini client.
         # A better approach would be to let the user select a tenant.
         tenant = db.query(Tenant).filter(Tenant.is_default == True).first()
@@ -416,11 +874,11 @@ def convert_rules_with_ai_task(sigma_rule_ids: List[int]):
         if not tenant:
             logging.error("No tenants configured for AI conversion.")
             # Mark all rules as failed
-            for rule_id in sigma_rule_ids:
-                db_rule = db.query(SigmaRule).filter(SigmaRule.rule_id == rule_id).first()
-                if db_rule:
-                    db_rule.conversion_status = "failed"
-                    db_rule.conversion_error = "No tenants configured for AI conversion."
+            db.query(SigmaRule).filter(SigmaRule.rule_id.in_(sigma_rule_ids)).update(
+                {SigmaRule.conversion_status: "failed", SigmaRule.conversion_error: "No tenants configured for AI conversion."},
+                synchronize_session=False
+            )
+            update_job(db, job_id, status="failed", error="No tenants configured for AI conversion.")
             db.commit()
             return
 
@@ -431,55 +889,61 @@ def convert_rules_with_ai_task(sigma_rule_ids: List[int]):
             region=tenant.region
         )
 
-        for rule_id in sigma_rule_ids:
-            db_rule = db.query(SigmaRule).filter(SigmaRule.rule_id == rule_id).first()
-            if not db_rule:
-                continue
-
-            try:
-                prompt = f"Convert this Sigma rule into YARA-L: {db_rule.raw_content}"
-                response = chronicle.gemini(prompt)
-                
-                logging.info(f"Gemini response for rule ID {rule_id}: {response}")
-
-                # I'll assume the YARA-L rule is in the first code block
-                code_blocks = response.get_code_blocks()
-                if not code_blocks:
-                    logging.error(f"AI conversion for rule ID {rule_id} resulted in no code block. Full response: {response}")
-                    raise ValueError("AI conversion resulted in no code block.")
-
-                yaral_content = code_blocks[0].content
-                
-                # FIX: Replace 'conditions:' with 'condition:' to address 3rd party library bug
-                yaral_content = yaral_content.replace("conditions:", "condition:")
-
-                existing_yaral = db.query(YaraLRule).filter(YaraLRule.sigma_rule_id == rule_id).first()
-                if existing_yaral:
-                    existing_yaral.converted_content = yaral_content
-                    existing_yaral.source = 'SecOps Gemini'
-                else:
-                    new_yaral_rule = YaraLRule(
-                        sigma_rule_id=rule_id,
-                        converted_content=yaral_content,
-                        source='SecOps Gemini'
-                    )
-                    db.add(new_yaral_rule)
-                
-                db_rule.conversion_status = "success"
-                db_rule.conversion_error = None
-
-            except Exception as e:
-                db_rule.conversion_status = "failed"
-                db_rule.conversion_error = str(e)
-                logging.error(f"Failed to convert rule ID {rule_id} with AI: {e}", exc_info=True)
-            
-            db.commit()
-        logging.info(f"AI conversion task finished. Processed {len(sigma_rule_ids)} rules.")
+        counts = {"cached": 0, "success": 0, "failed": 0}
+        cached: Dict[str, str] = {}
+        errors: Dict[str, str] = {} # Failed contents are not resent within this task
+        with ThreadPoolExecutor(max_workers=AI_CONVERSION_CONCURRENCY, thread_name_prefix="gemini") as executor:
+            for start in range(0, len(sigma_rule_ids), AI_CONVERSION_BATCH_SIZE):
+                batch_ids = sigma_rule_ids[start:start + AI_CONVERSION_BATCH_SIZE]
+                db_rules = db.query(SigmaRule).filter(SigmaRule.rule_id.in_(batch_ids)).all()
+                existing_yarals = {y.sigma_rule_id: y for y in db.query(YaraLRule).filter(YaraLRule.sigma_rule_id.in_(batch_ids))}
+                hashes = {db_rule.rule_id: content_hash(db_rule.raw_content) for db_rule in db_rules}
+                cached.update(db.query(ConversionCache.content_hash, ConversionCache.converted_content).filter(
+                    ConversionCache.converter == AI_CONVERTER, ConversionCache.content_hash.in_(set(hashes.values()) - cached.keys())
+                ))
+
+                # Send each distinct uncached content once.
+                futures = {}
+                for db_rule in db_rules:
+                    rule_hash = hashes[db_rule.rule_id]
+                    if rule_hash not in cached and rule_hash not in errors and rule_hash not in futures:
+                        futures[rule_hash] = executor.submit(convert_rule_with_gemini, chronicle, db_rule.raw_content)
+
+                cache_rows = []
+                for db_rule in db_rules:
+                    rule_hash = hashes[db_rule.rule_id]
+                    if rule_hash in cached:
+                        save_conversion(db, db_rule, existing_yarals.get(db_rule.rule_id), cached[rule_hash], AI_CONVERTER)
+                        counts["cached"] += 1
+                        continue
+                    try:
+                        if rule_hash in errors:
+                            raise ValueError(errors[rule_hash])
+                        yaral_content = futures[rule_hash].result()
+                    except Exception as e:
+                        errors[rule_hash] = str(e)
+                        db_rule.conversion_status = "failed"
+                        db_rule.conversion_error = str(e)
+                        logging.error(f"Failed to convert rule ID {db_rule.rule_id} with AI: {e}")
+                        counts["failed"] += 1
+                        continue
+                    save_conversion(db, db_rule, existing_yarals.get(db_rule.rule_id), yaral_content, AI_CONVERTER)
+                    cache_rows.append({"content_hash": rule_hash, "converter": AI_CONVERTER, "converted_content": yaral_content})
+                    counts["success"] += 1
+                # Later copies of a content converted in this batch reuse the first answer.
+                cached.update({row["content_hash"]: row["converted_content"] for row in cache_rows})
+
+                if cache_rows:
+                    db.execute(sqlite_insert(ConversionCache.__table__).on_conflict_do_nothing(), cache_rows)
+                update_job(db, job_id, processed=min(start + AI_CONVERSION_BATCH_SIZE, len(sigma_rule_ids)), result=counts)
+                db.commit()
+
+        logging.info(f"AI conversion task finished. Processed {len(sigma_rule_ids)} rules: {counts}.")
     finally:
         db.close()
 
 # --- NEW: Background Task for Rule Deployment ---
-def deploy_rule_task(deployment_id: int):
+def deploy_rule_task(deployment_id: int, job_id: Optional[int] = None):
     """
     Handles the actual deployment of a YARA-L rule to a SecOps tenant.
     """
@@ -520,6 +984,7 @@ def deploy_rule_task(deployment_id: int):
 
         except Exception as e:
             deployment.status = "error"
+            update_job(db, job_id, status="failed", error=str(e))
             logging.error(f"Failed to deploy rule ID {yaral_rule.yaral_rule_id} to tenant {tenant.tenant_id}: {e}")
         
         db.commit()
@@ -528,6 +993,165 @@ def deploy_rule_task(deployment_id: int):
         db.close()
 
 
+# --- Job Queue ---
+# Syncs, conversions and deployments are queued in the jobs table and run by worker processes
+# (python worker.py), so they survive restarts and do not compete with API requests. A worker claims
+# queued jobs with a conditional UPDATE, runs at most SIGMA_WORKER_<TYPE>_CONCURRENCY jobs of each
+# type at once and refreshes their heartbeat. Running jobs whose heartbeat stops are requeued.
+JOB_TYPES = {
+    # job type: (default worker concurrency, attempts before a job with a lost worker fails)
+    "sync": (1, 3),
+    "conversion": (1, 3),
+    "ai_conversion": (2, 3),
+    "deployment": (4, 1), # Rerunning a deployment could create the rule twice
+}
+JOB_CONCURRENCY = {job_type: int(os.getenv(f"SIGMA_WORKER_{job_type.upper()}_CONCURRENCY", str(concurrency))) for job_type, (concurrency, _) in JOB_TYPES.items()}
+JOB_QUEUE_LIMIT = int(os.getenv("SIGMA_JOB_QUEUE_LIMIT", "100")) # Queued jobs per type
+JOB_POLL_SECONDS = float(os.getenv("SIGMA_WORKER_POLL_SECONDS", "2"))
+JOB_HEARTBEAT_SECONDS = 30
+JOB_STALE_SECONDS = int(os.getenv("SIGMA_JOB_STALE_SECONDS", "300"))
+# Without a worker nothing queued ever runs, so by default the API process runs one itself.
+# Set SIGMA_EMBEDDED_WORKER=false when running python worker.py separately.
+EMBEDDED_WORKER = os.getenv("SIGMA_EMBEDDED_WORKER", "true").lower() == "true"
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any], int], None]] = {
+    "sync": lambda payload, job_id: sync_sigma_rules(payload["library_id"], job_id),
+    "conversion": lambda payload, job_id: convert_rules_task(payload["sigma_rule_ids"], job_id),
+    "ai_conversion": lambda payload, job_id: convert_rules_with_ai_task(payload["sigma_rule_ids"], job_id),
+    "deployment": lambda payload, job_id: deploy_rule_task(payload["deployment_id"], job_id),
+}
+
+def update_job(db: Session, job_id: Optional[int], **values):
+    """Sets job columns; committed with the caller's next commit. A dict result is stored as JSON."""
+    if job_id is None:
+        return
+    job = db.query(Job).filter(Job.job_id == job_id).first()
+    if job:
+        if isinstance(values.get("result"), dict):
+            values["result"] = json.dumps(values["result"])
+        for key, value in values.items():
+            setattr(job, key, value)
+
+def enqueue_job(db: Session, job_type: str, payload: Dict[str, Any], total: int = 0, coalesce: bool = False) -> Job:
+    """
+    Queues a job for the workers. With coalesce, an identical queued or running job is returned instead.
+    Raises a 429 when JOB_QUEUE_LIMIT jobs of the type are already queued.
+    """
+    payload_json = json.dumps(payload, sort_keys=True)
+    if coalesce:
+        existing = db.query(Job).filter(Job.job_type == job_type, Job.payload == payload_json, Job.status.in_(["queued", "running"])).first()
+        if existing:
+            return existing
+    if db.query(Job).filter(Job.job_type == job_type, Job.status == "queued").count() >= JOB_QUEUE_LIMIT:
+        raise HTTPException(status_code=429, detail=f"Too many queued {job_type} jobs. Try again later.")
+    job = Job(job_type=job_type, payload=payload_json, total=total, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def claim_job(job_type: str, worker_id: str) -> Optional[int]:
+    """Marks the oldest queued job of the type as running for this worker. Returns its ID, or None if there is none or another worker won."""
+    with SessionLocal() as db:
+        candidate = db.query(Job.job_id).filter(Job.job_type == job_type, Job.status == "queued").order_by(Job.job_id).first()
+        if not candidate:
+            return None
+        now = datetime.datetime.utcnow()
+        claimed = db.query(Job).filter(Job.job_id == candidate.job_id, Job.status == "queued").update({
+            Job.status: "running", Job.worker_id: worker_id, Job.started_at: now, Job.heartbeat_at: now,
+            Job.attempts: func.coalesce(Job.attempts, 0) + 1
+        }, synchronize_session=False)
+        db.commit()
+        return candidate.job_id if claimed else None
+
+def run_job(job_id: int):
+    """Runs a claimed job's handler and records whether it succeeded. Handlers may fail the job themselves."""
+    with SessionLocal() as db:
+        job = db.query(Job).filter(Job.job_id == job_id).first()
+        job_type, payload = job.job_type, json.loads(job.payload or "{}")
+    logging.info(f"Running {job_type} job {job_id}.")
+    status, error = "succeeded", None
+    try:
+        JOB_HANDLERS[job_type](payload, job_id)
+    except Exception as e:
+        logging.error(f"{job_type} job {job_id} failed: {e}", exc_info=True)
+        status, error = "failed", str(e)
+    with SessionLocal() as db:
+        job = db.query(Job).filter(Job.job_id == job_id).first()
+        if job.status == "running":
+            job.status, job.error = status, error
+        job.finished_at = datetime.datetime.utcnow()
+        db.commit()
+        logging.info(f"{job_type} job {job_id} finished with status '{job.status}'.")
+
+def heartbeat_jobs(job_ids: List[int]):
+    if not job_ids:
+        return
+    with SessionLocal() as db:
+        db.query(Job).filter(Job.job_id.in_(job_ids), Job.status == "running").update(
+            {Job.heartbeat_at: datetime.datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+
+def requeue_stale_jobs():
+    """Requeues running jobs whose worker stopped sending heartbeats, or fails them once they used up their attempts."""
+    cutoff = datetime.datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    with SessionLocal() as db:
+        for job in db.query(Job).filter(Job.status == "running", Job.heartbeat_at < cutoff):
+            max_attempts = JOB_TYPES.get(job.job_type, (0, 1))[1]
+            if (job.attempts or 0) >= max_attempts:
+                logging.warning(f"{job.job_type} job {job.job_id} lost its worker {job.worker_id} after {job.attempts} attempt(s). Failing it.")
+                job.status = "failed"
+                job.error = f"Worker {job.worker_id} stopped while running the job."
+                job.finished_at = datetime.datetime.utcnow()
+            else:
+                logging.warning(f"{job.job_type} job {job.job_id} lost its worker {job.worker_id}. Requeueing it.")
+                job.status = "queued"
+                job.worker_id = None
+        db.commit()
+
+def run_worker(job_types: Optional[List[str]] = None, stop_event: Optional[threading.Event] = None):
+    """Claims and runs queued jobs of the given types (default: all) until stop_event is set."""
+    job_types = [job_type for job_type in (job_types or list(JOB_HANDLERS)) if JOB_CONCURRENCY.get(job_type, 0) > 0]
+    stop_event = stop_event or threading.Event()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    executors = {job_type: ThreadPoolExecutor(max_workers=JOB_CONCURRENCY[job_type], thread_name_prefix=f"job-{job_type}") for job_type in job_types}
+    running: Dict[str, set] = {job_type: set() for job_type in job_types}
+    running_lock = threading.Lock()
+    last_heartbeat = 0.0
+    logging.info(f"Worker {worker_id} started for job types {', '.join(f'{t} ({JOB_CONCURRENCY[t]})' for t in job_types)}.")
+
+    def finished(job_type: str, job_id: int):
+        with running_lock:
+            running[job_type].discard(job_id)
+
+    try:
+        while not stop_event.is_set():
+            if time.monotonic() - last_heartbeat >= JOB_HEARTBEAT_SECONDS:
+                with running_lock:
+                    running_ids = [job_id for job_ids in running.values() for job_id in job_ids]
+                heartbeat_jobs(running_ids)
+                requeue_stale_jobs()
+                last_heartbeat = time.monotonic()
+
+            claimed = False
+            for job_type in job_types:
+                with running_lock:
+                    has_capacity = len(running[job_type]) < JOB_CONCURRENCY[job_type]
+                job_id = claim_job(job_type, worker_id) if has_capacity else None
+                if job_id:
+                    with running_lock:
+                        running[job_type].add(job_id)
+                    executors[job_type].submit(run_job, job_id).add_done_callback(lambda _, t=job_type, j=job_id: finished(t, j))
+                    claimed = True
+            if not claimed:
+                stop_event.wait(JOB_POLL_SECONDS)
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+        logging.info(f"Worker {worker_id} stopped.")
+
+
 class APIError(Exception):
     pass
 
@@ -683,16 +1307,15 @@ def get_libraries(db: Session = Depends(get_db)):
     return db.query(SigmaLibrary).all()
 
 @app.post("/api/libraries/{library_id}/sync", response_model=dict, tags=["Sigma Library Management"])
-def sync_library_endpoint(library_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    """Trigger a background job to sync rules from the library's source."""
+def sync_library_endpoint(library_id: int, db: Session = Depends(get_db)):
+    """Queue a job to sync rules from the library's source. A sync already queued or running for the library is returned instead."""
     db_library = db.query(SigmaLibrary).filter(SigmaLibrary.library_id == library_id).first()
     if not db_library:
         raise HTTPException(status_code=404, detail="Library not found")
     
-    # Add the sync function to run in the background
-    background_tasks.add_task(sync_sigma_rules, library_id)
+    job = enqueue_job(db, "sync", {"library_id": library_id}, coalesce=True)
     
-    return {"status": "sync_started", "message": f"Sync job initiated for library {db_library.name}."}
+    return {"status": "sync_started", "message": f"Sync job initiated for library {db_library.name}.", "job_id": job.job_id}
 
 # --- Rule Management & Conversion ---
 @app.get("/api/sigma-rules", response_model=List[SigmaRuleResponse], tags=["Rule Management & Conversion"])
@@ -705,6 +1328,7 @@ def get_sigma_rules(
     rule_ids: Optional[List[int]] = Query(None), 
     db: Session = Depends(get_db)
 ):
+    """Lists rules. search matches any part of the title, description, author or file path, e.g. "katz" finds mimikatz."""
     query = db.query(SigmaRule)
     if library_id: query = query.filter(SigmaRule.library_id == library_id)
     if status: query = query.filter(SigmaRule.conversion_status == status)
@@ -712,17 +1336,41 @@ def get_sigma_rules(
     if tag:
         query = query.join(SigmaRule.tags).filter(func.lower(Tag.name) == tag.lower())
     if search:
-        search_term = f"%{search.lower()}%"
-        query = query.filter(or_(
-            func.lower(SigmaRule.title).like(search_term),
-            func.lower(SigmaRule.description).like(search_term),
-            func.lower(SigmaRule.author).like(search_term),
-            func.lower(SigmaRule.file_path).like(search_term)
-        ))
+        query = filter_rules_by_search(query, search)
     if rule_ids:
         query = query.filter(SigmaRule.rule_id.in_(rule_ids))
     return query.all()
 
+@app.get("/api/sigma-rules/search", response_model=List[SigmaRuleResponse], tags=["Rule Management & Conversion"])
+def search_sigma_rules(
+    q: str,
+    library_id: Optional[int] = None,
+    status: Optional[str] = None,
+    limit: int = Query(200, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """
+    Ranked full-text search over title, description, author, file path, tags and logsource.
+    Every word matches as a prefix, e.g. "mimi lsass" finds rules mentioning mimikatz and lsass.
+    """
+    fts_query = build_search_query(q)
+    if not fts_query:
+        return []
+
+    if SEARCH_INDEX_AVAILABLE:
+        query = db.query(SigmaRule).join(sigma_rules_fts, sigma_rules_fts.c.rowid == SigmaRule.rule_id).filter(
+            text("sigma_rules_fts MATCH :fts_query").bindparams(fts_query=fts_query)
+        )
+    else:
+        # Unranked LIKE matches, limited in SQL like the ranked results.
+        query = filter_rules_by_search(db.query(SigmaRule), q)
+    if library_id: query = query.filter(SigmaRule.library_id == library_id)
+    if status: query = query.filter(SigmaRule.conversion_status == status)
+    if SEARCH_INDEX_AVAILABLE:
+        weights = ", ".join(str(w) for w in SEARCH_RANK_WEIGHTS)
+        query = query.order_by(text(f"bm25(sigma_rules_fts, {weights})"))
+    return query.limit(limit).all()
+
 @app.get("/api/sigma-rules/{rule_id}", response_model=SigmaRuleDetailResponse, tags=["Rule Management & Conversion"])
 def get_sigma_rule_details(rule_id: int, db: Session = Depends(get_db)):
     db_rule = db.query(SigmaRule).filter(SigmaRule.rule_id == rule_id).first()
@@ -731,7 +1379,7 @@ def get_sigma_rule_details(rule_id: int, db: Session = Depends(get_db)):
     return db_rule
 
 @app.post("/api/sigma-rules/convert", response_model=dict, tags=["Rule Management & Conversion"])
-def convert_sigma_rules(request: ConvertRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def convert_sigma_rules(request: ConvertRequest, db: Session = Depends(get_db)):
     """
     Takes a list of sigma_rule_ids and triggers a background job to convert them.
     """
@@ -741,12 +1389,12 @@ def convert_sigma_rules(request: ConvertRequest, background_tasks: BackgroundTas
     if len(rules_to_convert) != len(request.sigma_rule_ids):
         raise HTTPException(status_code=404, detail="One or more rule IDs not found.")
 
-    background_tasks.add_task(convert_rules_task, request.sigma_rule_ids)
+    job = enqueue_job(db, "conversion", {"sigma_rule_ids": request.sigma_rule_ids}, total=len(request.sigma_rule_ids))
 
-    return {"status": "conversion_started", "message": f"Conversion job initiated for {len(request.sigma_rule_ids)} rules."}
+    return {"status": "conversion_started", "message": f"Conversion job initiated for {len(request.sigma_rule_ids)} rules.", "job_id": job.job_id}
 
 @app.post("/api/sigma-rules/convert-with-ai", response_model=dict, tags=["Rule Management & Conversion"])
-def convert_sigma_rules_with_ai(request: ConvertRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def convert_sigma_rules_with_ai(request: ConvertRequest, db: Session = Depends(get_db)):
     """
     Takes a list of sigma_rule_ids and triggers a background job to convert them using AI.
     """
@@ -755,9 +1403,25 @@ def convert_sigma_rules_with_ai(request: ConvertRequest, background_tasks: Backg
     if len(rules_to_convert) != len(request.sigma_rule_ids):
         raise HTTPException(status_code=404, detail="One or more rule IDs not found.")
 
-    background_tasks.add_task(convert_rules_with_ai_task, request.sigma_rule_ids)
+    job = enqueue_job(db, "ai_conversion", {"sigma_rule_ids": request.sigma_rule_ids}, total=len(request.sigma_rule_ids))
 
-    return {"status": "ai_conversion_started", "message": f"AI conversion job initiated for {len(request.sigma_rule_ids)} rules."}
+    return {"status": "ai_conversion_started", "message": f"AI conversion job initiated for {len(request.sigma_rule_ids)} rules.", "job_id": job.job_id}
+
+@app.get("/api/jobs", response_model=List[JobResponse], tags=["Jobs"])
+def get_jobs(status: Optional[str] = None, job_type: Optional[str] = None, limit: int = 50, db: Session = Depends(get_db)):
+    """Lists background jobs, newest first."""
+    query = db.query(Job)
+    if status: query = query.filter(Job.status == status)
+    if job_type: query = query.filter(Job.job_type == job_type)
+    return query.order_by(Job.job_id.desc()).limit(limit).all()
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse, tags=["Jobs"])
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    """Returns a background job's status and progress, for polling."""
+    job = db.query(Job).filter(Job.job_id == job_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @app.get("/api/yaral-rules", response_model=List[YaraLRuleResponse], tags=["Rule Management & Conversion"])
@@ -906,7 +1570,7 @@ def get_deployments(tenant_id: Optional[int] = None, db: Session = Depends(get_d
 
 # --- Deployment Endpoint ---
 @app.post("/api/deployments", response_model=dict, tags=["Deployment & Performance"])
-def deploy_rule(request: DeployRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def deploy_rule(request: DeployRequest, db: Session = Depends(get_db)):
     # Check if the rule and tenant exist before starting the task
     yaral_rule = db.query(YaraLRule).filter(YaraLRule.yaral_rule_id == request.yaral_rule_id).first()
     tenant = db.query(Tenant).filter(Tenant.tenant_id == request.tenant_id).first()
@@ -920,13 +1584,27 @@ def deploy_rule(request: DeployRequest, background_tasks: BackgroundTasks, db: S
         status="pending"
     )
     db.add(new_deployment)
-    db.commit()
-    db.refresh(new_deployment)
+    # Flushed only, so the deployment is committed together with its job and a full queue leaves no orphan.
+    db.flush()
     
-    # Start the background task to perform the actual deployment
-    background_tasks.add_task(deploy_rule_task, new_deployment.deployment_id)
+    # Queue the job that performs the actual deployment
+    job = enqueue_job(db, "deployment", {"deployment_id": new_deployment.deployment_id})
     
-    return {"status": "deployment_started", "deployment_id": new_deployment.deployment_id}
+    return {"status": "deployment_started", "deployment_id": new_deployment.deployment_id, "job_id": job.job_id}
+
+# --- Embedded Worker ---
+# On by default for single-process setups. Production deployments set SIGMA_EMBEDDED_WORKER=false
+# and run python worker.py next to the API instead.
+_embedded_worker_stop = threading.Event()
+
+@app.on_event("startup")
+def start_embedded_worker():
+    if EMBEDDED_WORKER:
+        threading.Thread(target=run_worker, kwargs={"stop_event": _embedded_worker_stop}, name="embedded-worker", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_embedded_worker():
+    _embedded_worker_stop.set()
 
 # --- Uvicorn Runner ---
 if __name__ == "__main__":
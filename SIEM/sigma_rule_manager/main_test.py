@@ -0,0 +1,383 @@
+"""Unit tests for the Sigma rule manager sync, conversion, job queue and search."""
+
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import main
+
+
+def _session_factory(test_case):
+    """Creates an in-memory database with the search index and patches main.SessionLocal to use it."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    main.Base.metadata.create_all(bind=engine)
+    main.create_search_index(engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    patcher = mock.patch.object(main, "SessionLocal", session_factory)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    test_case.addCleanup(engine.dispose)
+    return session_factory
+
+
+def _rule_yaml(title, description, tags=()):
+    """Builds the YAML of a Sigma rule; the description keeps files distinct for git rename detection."""
+    lines = [f"title: {title}", f"id: {title.lower().replace(' ', '-')}", "status: test", f"description: {description}", "author: tester"]
+    if tags:
+        lines += ["tags:"] + [f"    - {tag}" for tag in tags]
+    lines += ["logsource:", "    product: windows", "detection:", "    selection:", f"        Image: '{title}.exe'", "    condition: selection"]
+    return "\n".join(lines) + "\n"
+
+
+class _SourceRepo:
+    """A local git repository the sync task clones and pulls from."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path)
+        self.git("init", "-q")
+        self.git("config", "user.email", "tests@example.com")
+        self.git("config", "user.name", "tests")
+
+    def git(self, *args):
+        subprocess.run(["git", *args], cwd=self.path, check=True, capture_output=True)
+
+    def write(self, relative_path, content):
+        full_path = os.path.join(self.path, relative_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def commit(self, message):
+        self.git("add", "-A")
+        self.git("commit", "-q", "-m", message)
+
+
+class TestSyncSigmaRules(unittest.TestCase):
+    """Unit test class for the incremental library sync."""
+
+    def setUp(self):
+        self.session_factory = _session_factory(self)
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        # The sync task clones into ./sigma_repos relative to the working directory.
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(workdir)
+        self.repo = _SourceRepo(os.path.join(workdir, "source"))
+        self.repo.write("rules/process.yml", _rule_yaml("Process Start", "Suspicious process creation from a temp folder", ["attack.execution"]))
+        self.repo.write("rules/network.yml", _rule_yaml("Network Beacon", "Periodic outbound connections to a rare domain", ["attack.command_and_control"]))
+        self.repo.write("rules/registry.yml", _rule_yaml("Registry Run Key", "Persistence through a new autorun registry value", ["attack.persistence"]))
+        self.repo.write("rules/service.yml", _rule_yaml("Service Install", "A service was installed with an unusual binary path"))
+        self.repo.commit("initial rules")
+        with self.session_factory() as db:
+            library = main.SigmaLibrary(name="test library", source_path=self.repo.path)
+            db.add(library)
+            db.commit()
+            self.library_id = library.library_id
+
+    def rules_by_path(self, db):
+        return {rule.file_path: rule for rule in db.query(main.SigmaRule)}
+
+    def test_incremental_sync_applies_changes(self):
+        """Test case to verify an incremental sync applies a modify, a delete and a rename.
+
+        Asserts:
+            - The modified rule is updated and needs converting again.
+            - The deleted rule is removed and the renamed rule keeps its conversion state.
+            - Untouched rules keep their conversion state and the new HEAD is recorded.
+        """
+        main.sync_sigma_rules(self.library_id)
+        with self.session_factory() as db:
+            self.assertEqual(len(self.rules_by_path(db)), 4)
+            db.query(main.SigmaRule).update({main.SigmaRule.conversion_status: "success"})
+            db.commit()
+
+        self.repo.write("rules/process.yml", _rule_yaml("Process Start", "Suspicious process creation from a downloads folder", ["attack.execution"]))
+        os.remove(os.path.join(self.repo.path, "rules/network.yml"))
+        os.renames(os.path.join(self.repo.path, "rules/registry.yml"), os.path.join(self.repo.path, "rules/persistence/registry.yml"))
+        self.repo.commit("modify, delete and rename")
+
+        with mock.patch.object(main, "parse_rule_files", wraps=main.parse_rule_files) as parse:
+            main.sync_sigma_rules(self.library_id)
+        read_paths = sorted(path for call in parse.call_args_list for path in call.args[1])
+
+        with self.session_factory() as db:
+            rules = self.rules_by_path(db)
+            library = db.get(main.SigmaLibrary, self.library_id)
+            self.assertEqual(sorted(rules), ["rules/persistence/registry.yml", "rules/process.yml", "rules/service.yml"])
+            self.assertEqual(read_paths, ["rules/persistence/registry.yml", "rules/process.yml"])
+            self.assertIn("downloads folder", rules["rules/process.yml"].description)
+            self.assertEqual(rules["rules/process.yml"].conversion_status, "pending")
+            self.assertEqual(rules["rules/persistence/registry.yml"].conversion_status, "success")
+            self.assertEqual(rules["rules/service.yml"].conversion_status, "success")
+            self.assertEqual(library.last_synced_commit, subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=self.repo.path, text=True).strip())
+
+    def test_failed_files_are_read_again(self):
+        """Test case to verify a file that failed to parse is retried by the next sync without new commits."""
+        parse_rule_file = main.parse_rule_file
+
+        def failing_parse(raw_content):
+            if "Network Beacon" in raw_content:
+                raise OSError("temporarily unreadable")
+            return parse_rule_file(raw_content)
+
+        with mock.patch.object(main, "parse_rule_file", side_effect=failing_parse):
+            main.sync_sigma_rules(self.library_id)
+        with self.session_factory() as db:
+            self.assertNotIn("rules/network.yml", self.rules_by_path(db))
+            self.assertEqual(db.get(main.SigmaLibrary, self.library_id).failed_paths, '["rules/network.yml"]')
+
+        main.sync_sigma_rules(self.library_id)
+
+        with self.session_factory() as db:
+            self.assertIn("rules/network.yml", self.rules_by_path(db))
+            self.assertIsNone(db.get(main.SigmaLibrary, self.library_id).failed_paths)
+
+    def test_already_synced_job_reports_counts(self):
+        """Test case to verify a sync with nothing to do still records the job's counts."""
+        main.sync_sigma_rules(self.library_id)
+        with self.session_factory() as db:
+            db.add(main.Job(job_id=1, job_type="sync", status="running"))
+            db.commit()
+
+        main.sync_sigma_rules(self.library_id, job_id=1)
+
+        with self.session_factory() as db:
+            self.assertEqual(json.loads(db.get(main.Job, 1).result)["added"], 0)
+
+
+class TestUpsertRuleBatch(unittest.TestCase):
+    """Unit test class for the bulk rule and tag upsert."""
+
+    def setUp(self):
+        self.db = _session_factory(self)()
+        self.addCleanup(self.db.close)
+        self.db.add_all([main.SigmaLibrary(library_id=1, name="one", source_path="one"), main.SigmaLibrary(library_id=2, name="two", source_path="two")])
+        self.db.commit()
+
+    def upsert(self, library_id, title, tags):
+        record = main.parse_rule_file(_rule_yaml(title, f"{title} description", tags))
+        rule_tags = {"rules/shared.yml": record.pop("tags")}
+        rows = [{**record, "file_path": "rules/shared.yml", "library_id": library_id, "conversion_status": "pending", "conversion_error": None}]
+        return main.upsert_rule_batch(self.db, library_id, rows, rule_tags, self.tag_ids)
+
+    def test_replaces_tag_associations(self):
+        """Test case to verify an updated rule's tag associations are rebuilt rather than appended to.
+
+        Asserts:
+            - The second upsert updates the rule in place with exactly its new tags.
+            - Tags created by the upsert are added to tag_ids.
+        """
+        self.tag_ids = {}
+        self.assertEqual(self.upsert(1, "Original", ["attack.execution", "attack.t1059"]), [])
+        self.assertEqual(self.upsert(1, "Edited", ["attack.t1059", "attack.persistence"]), [])
+        self.db.commit()
+
+        rule = self.db.query(main.SigmaRule).one()
+        self.assertEqual(rule.title, "Edited")
+        self.assertEqual(sorted(tag.name for tag in rule.tags), ["attack.persistence", "attack.t1059"])
+        self.assertEqual(set(self.tag_ids), {"attack.execution", "attack.t1059", "attack.persistence"})
+
+    def test_skips_paths_of_other_libraries(self):
+        """Test case to verify a file path owned by another library is reported as skipped and left untouched."""
+        self.tag_ids = {}
+        self.upsert(1, "Library One", ["attack.execution"])
+
+        with self.assertLogs(level="WARNING"):
+            skipped = self.upsert(2, "Library Two", ["attack.persistence"])
+        self.db.commit()
+
+        self.assertEqual(skipped, ["rules/shared.yml"])
+        rule = self.db.query(main.SigmaRule).one()
+        self.assertEqual((rule.library_id, rule.title), (1, "Library One"))
+        self.assertEqual([tag.name for tag in rule.tags], ["attack.execution"])
+
+
+class TestConvertRulesTask(unittest.TestCase):
+    """Unit test class for the pySigma conversion task and its content-hash cache."""
+
+    def setUp(self):
+        self.session_factory = _session_factory(self)
+        raw_content = _rule_yaml("Process Start", "Suspicious process creation")
+        with self.session_factory() as db:
+            db.add(main.SigmaLibrary(library_id=1, name="one", source_path="one"))
+            db.add_all([
+                main.SigmaRule(rule_id=rule_id, library_id=1, file_path=f"rules/{rule_id}.yml", title="Process Start", raw_content=raw_content, conversion_status="pending")
+                for rule_id in (1, 2)
+            ])
+            db.add(main.Job(job_id=1, job_type="conversion", status="running"))
+            db.commit()
+
+    def test_cached_content_is_not_converted_again(self):
+        """Test case to verify a rule whose content was converted before is served from the cache.
+
+        Asserts:
+            - The first conversion runs the converter once and caches its output.
+            - Converting a rule with the same content stores the cached output without converting.
+        """
+        with mock.patch.object(main, "convert_rule_contents", return_value=[("rule process_start {}", None)]) as convert:
+            main.convert_rules_task([1])
+        self.assertEqual(convert.call_count, 1)
+
+        with mock.patch.object(main, "convert_rule_contents", return_value=[]) as convert:
+            main.convert_rules_task([2], job_id=1)
+        convert.assert_called_once_with([])
+
+        with self.session_factory() as db:
+            self.assertEqual(db.query(main.ConversionCache).count(), 1)
+            rule = db.get(main.SigmaRule, 2)
+            self.assertEqual(rule.conversion_status, "success")
+            self.assertEqual(rule.yaral_rule.converted_content, "rule process_start {}")
+            self.assertEqual(json.loads(db.get(main.Job, 1).result), {"cached": 1, "success": 0, "failed": 0})
+
+    def test_converter_version_change_misses_cache(self):
+        """Test case to verify cached outputs of another pySigma/backend version are not reused."""
+        with mock.patch.object(main, "convert_rule_contents", return_value=[("rule old {}", None)]):
+            main.convert_rules_task([1])
+
+        with mock.patch.object(main, "get_converter_version", return_value="pySigma 99/secops 99"), \
+                mock.patch.object(main, "convert_rule_contents", return_value=[("rule new {}", None)]) as convert:
+            main.convert_rules_task([2])
+
+        self.assertEqual(convert.call_count, 1)
+        with self.session_factory() as db:
+            self.assertEqual(db.get(main.SigmaRule, 2).yaral_rule.converted_content, "rule new {}")
+
+
+class TestJobQueue(unittest.TestCase):
+    """Unit test class for claiming, running and requeueing queued jobs."""
+
+    def setUp(self):
+        self.session_factory = _session_factory(self)
+
+    def add_job(self, job_type, status="queued", **values):
+        with self.session_factory() as db:
+            job = main.Job(job_type=job_type, status=status, payload="{}", **values)
+            db.add(job)
+            db.commit()
+            return job.job_id
+
+    def test_claim_job_takes_oldest_queued_job(self):
+        """Test case to verify a worker claims the oldest queued job of its type, once.
+
+        Asserts:
+            - The oldest queued job is marked running for the worker and its attempts are counted.
+            - A job that is already running is not claimed again.
+        """
+        first = self.add_job("sync")
+        self.add_job("conversion")
+
+        self.assertEqual(main.claim_job("sync", "host:1"), first)
+        self.assertIsNone(main.claim_job("sync", "host:2"))
+
+        with self.session_factory() as db:
+            job = db.get(main.Job, first)
+            self.assertEqual((job.status, job.worker_id, job.attempts), ("running", "host:1", 1))
+
+    def test_requeue_stale_jobs_respects_attempts(self):
+        """Test case to verify jobs whose worker stopped are requeued until they used up their attempts.
+
+        Asserts:
+            - A stale sync job under its attempts limit is queued again.
+            - A stale deployment, which allows one attempt, is failed.
+            - A job with a recent heartbeat is left running.
+        """
+        stale = datetime.datetime.utcnow() - datetime.timedelta(seconds=main.JOB_STALE_SECONDS + 60)
+        sync_job = self.add_job("sync", "running", attempts=1, worker_id="host:1", heartbeat_at=stale)
+        deployment_job = self.add_job("deployment", "running", attempts=1, worker_id="host:1", heartbeat_at=stale)
+        live_job = self.add_job("conversion", "running", attempts=1, worker_id="host:2", heartbeat_at=datetime.datetime.utcnow())
+
+        with self.assertLogs(level="WARNING"):
+            main.requeue_stale_jobs()
+
+        with self.session_factory() as db:
+            self.assertEqual((db.get(main.Job, sync_job).status, db.get(main.Job, sync_job).worker_id), ("queued", None))
+            self.assertEqual(db.get(main.Job, deployment_job).status, "failed")
+            self.assertEqual(db.get(main.Job, live_job).status, "running")
+
+    def test_sync_of_missing_library_fails_job(self):
+        """Test case to verify a sync job for a library that no longer exists is recorded as failed."""
+        with self.session_factory() as db:
+            db.add(main.Job(job_id=1, job_type="sync", status="running", payload='{"library_id": 42}'))
+            db.commit()
+
+        with self.assertLogs(level="ERROR"):
+            main.run_job(1)
+
+        with self.session_factory() as db:
+            job = db.get(main.Job, 1)
+            self.assertEqual(job.status, "failed")
+            self.assertIn("42", job.error)
+
+    def test_full_queue_leaves_no_deployment(self):
+        """Test case to verify a deployment rejected by a full job queue is not stored."""
+        with self.session_factory() as db:
+            db.add(main.Tenant(tenant_id=1, name="tenant", guid="guid"))
+            db.add(main.YaraLRule(yaral_rule_id=1, converted_content="rule x {}"))
+            db.commit()
+
+            with mock.patch.object(main, "JOB_QUEUE_LIMIT", 0), self.assertRaises(main.HTTPException) as raised:
+                main.deploy_rule(main.DeployRequest(yaral_rule_id=1, tenant_id=1), db)
+            db.rollback()
+
+            self.assertEqual(raised.exception.status_code, 429)
+            self.assertEqual(db.query(main.Deployment).count(), 0)
+
+
+class TestSearchSigmaRules(unittest.TestCase):
+    """Unit test class for the ranked rule search and its LIKE fallback."""
+
+    def setUp(self):
+        self.db = _session_factory(self)()
+        self.addCleanup(self.db.close)
+        self.db.add(main.SigmaLibrary(library_id=1, name="one", source_path="one"))
+        self.db.add_all([
+            main.SigmaRule(rule_id=1, library_id=1, file_path="rules/dump.yml", title="Credential Dumping", description="Reads lsass memory with mimikatz", conversion_status="pending"),
+            main.SigmaRule(rule_id=2, library_id=1, file_path="rules/mimikatz.yml", title="Mimikatz Execution", description="Known hacktool command line", conversion_status="success"),
+            main.SigmaRule(rule_id=3, library_id=1, file_path="rules/other.yml", title="Mimikatz Module Load", description="Loads a mimikatz module", conversion_status="pending"),
+            main.SigmaRule(rule_id=4, library_id=1, file_path="rules/net.yml", title="Network Beacon", description="Periodic connections", conversion_status="pending"),
+        ])
+        self.db.flush()
+        main.index_rules_for_search(self.db, [1, 2, 3, 4])
+        self.db.commit()
+
+    def search(self, q, **filters):
+        return [rule.rule_id for rule in main.search_sigma_rules(q=q, library_id=filters.get("library_id"), status=filters.get("status"), limit=filters.get("limit", 200), db=self.db)]
+
+    def test_title_matches_rank_first(self):
+        """Test case to verify rules whose title matches rank above rules that only mention the term.
+
+        Asserts:
+            - Title matches come before the description-only match.
+            - Prefix terms match and the status filter applies.
+        """
+        results = self.search("mimi")
+        self.assertEqual(set(results[:2]), {2, 3})
+        self.assertEqual(results[2:], [1])
+        self.assertEqual(self.search("mimi", status="success"), [2])
+
+    def test_rule_list_search_matches_substrings(self):
+        """Test case to verify the search filter of the rule list matches within words, unlike the prefix search."""
+        self.assertEqual(sorted(rule.rule_id for rule in main.get_sigma_rules(search="katz", rule_ids=None, db=self.db)), [1, 2, 3])
+        self.assertEqual(self.search("katz"), [])
+
+    def test_like_fallback_without_index(self):
+        """Test case to verify searches without FTS5 filter with LIKE and apply the filters and limit in SQL."""
+        with mock.patch.object(main, "SEARCH_INDEX_AVAILABLE", False):
+            self.assertEqual(sorted(self.search("mimikatz")), [1, 2, 3])
+            self.assertEqual(self.search("mimikatz", status="success"), [2])
+            self.assertEqual(len(self.search("mimikatz", limit=2)), 2)
+            self.assertEqual([rule.rule_id for rule in main.get_sigma_rules(search="beacon", rule_ids=None, db=self.db)], [4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+# worker.py
+# Runs the Sigma rule manager's queued background jobs outside the API process.
+#
+#   python worker.py                             # all job types
+#   python worker.py --types sync conversion     # only some, e.g. heavy jobs on a separate host
+#
+# Run it from the same directory as the API so it uses the same sigma_manager.db and sigma_repos.
+# Start the API with SIGMA_EMBEDDED_WORKER=false when using it, otherwise the API process runs jobs as well.
+# Per job type concurrency is set with SIGMA_WORKER_<TYPE>_CONCURRENCY, e.g. SIGMA_WORKER_AI_CONVERSION_CONCURRENCY=4.
+
+import argparse
+import logging
+import signal
+import threading
+
+import main
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued Sigma rule manager jobs.")
+    parser.add_argument("--types", nargs="+", choices=list(main.JOB_HANDLERS), help="Job types to run (default: all).")
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        # Finish the running jobs, but claim no new ones.
+        signal.signal(sig, lambda signum, frame: (logging.info("Stopping worker after the running jobs..."), stop_event.set()))
+    main.run_worker(args.types, stop_event)